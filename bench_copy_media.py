@@ -0,0 +1,59 @@
+"""
+Development and benchmarking stand for the copy read strategies.
+
+This script copies all files of the source directory with the interleaved (legacy) and the
+sequential read strategy and prints the throughput of each run. Page cache is dropped between
+runs when possible (Linux, root), otherwise the second run may be served from memory.
+
+A realistic source is a loopback-mounted FAT/exFAT image --v
+    truncate -s 4G card.img && mkfs.exfat card.img
+    sudo mount -o loop card.img /mnt/card  (and fill it with media files)
+    python bench_copy_media.py /mnt/card /tmp/bench_dst
+
+usage --v
+    python bench_copy_media.py <source_dir> <destination_dir>
+"""
+import asyncio
+import os
+import shutil
+import sys
+import time
+
+from condocopy import copy_files
+
+
+def drop_page_cache() -> bool:
+    try:
+        os.sync()
+        with open("/proc/sys/vm/drop_caches", 'w') as f:
+            f.write("3\n")
+        return True
+    except (OSError, AttributeError):
+        return False
+
+
+def run(file_list, dst_dir, sequential: bool) -> float:
+    shutil.rmtree(dst_dir, ignore_errors=True)
+    cache_dropped = drop_page_cache()
+    started = time.perf_counter()
+    asyncio.run(copy_files(file_list, dst_dir, sequential=sequential))
+    elapsed = time.perf_counter() - started
+    total_mb = sum(os.path.getsize(p) for p in file_list) / (1024 ** 2)
+    print(f"{'sequential' if sequential else 'interleaved':<12} {elapsed:>8.2f}s "
+          f"{total_mb / elapsed:>8.1f} MB/s  (page cache {'dropped' if cache_dropped else 'kept'})")
+    return elapsed
+
+
+#  ===================================================
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(__doc__)
+        quit(-1)
+    src_dir, dst_dir = sys.argv[1], sys.argv[2]
+    l_files = [os.path.join(root, name) for root, _, files in os.walk(src_dir) for name in files]
+    print(f"{len(l_files)} files in {src_dir}")
+
+    run(l_files, dst_dir, sequential=False)
+    run(l_files, dst_dir, sequential=True)
+    shutil.rmtree(dst_dir, ignore_errors=True)
@@ -0,0 +1,65 @@
+"""
+Development and benchmarking stand for the process-pool execution mode.
+
+This script times metadata analysis (key datetimes of the date layout), hashing and datetime
+parsing over the given directory (or over generated files) with an increasing number of worker
+processes and prints the speedup against one worker.
+
+usage --v
+    python bench_process_pool.py [directory_with_media_files]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from layout import compact_key_datetime
+from workers import default_workers, hash_file, parse_datetime, run_in_process_pool
+
+
+def create_files(directory, count, size_mb):
+    """Create  count  files of  size_mb  random megabytes"""
+    l_files = []
+    for i in range(count):
+        file_path = os.path.join(directory, f"bench_{i + 1}.dat")
+        with open(file_path, 'wb') as f:
+            f.write(os.urandom(size_mb * 1024 * 1024))
+        l_files.append(file_path)
+    return l_files
+
+
+def bench(title, func, items, chunk_size):
+    print(f"--- {title}: {len(items)} items, chunk {chunk_size}")
+    print(f"{'workers':>8} {'seconds':>10} {'speedup':>8}")
+    baseline = None
+    workers = 1
+    while True:
+        started = time.perf_counter()
+        run_in_process_pool(func, items, workers, chunk_size)
+        elapsed = time.perf_counter() - started
+        baseline = baseline or elapsed
+        print(f"{workers:>8} {elapsed:>10.3f} {baseline / elapsed:>8.2f}")
+        if workers >= default_workers():
+            break
+        workers = min(workers * 2, default_workers())
+
+
+#  ===================================================
+
+if __name__ == "__main__":  # required by worker processes started with "spawn" (Windows)
+    if len(sys.argv) > 1:
+        directory = sys.argv[1]
+        l_files = [os.path.join(root, name) for root, _, files in os.walk(directory) for name in files]
+    else:
+        directory = tempfile.mkdtemp(prefix="condocopy_bench_")
+        l_files = create_files(directory, 64, 8)
+        print(f"{len(l_files)} files generated in {directory}")
+
+    bench("compact_key_datetime", compact_key_datetime, l_files, chunk_size=8)
+    bench("hash_file", hash_file, l_files, chunk_size=4)
+
+    dt_strings = [f"{random.randint(2000, 2030)}:{random.randint(1, 12):02}:{random.randint(1, 28):02} "
+                  f"{random.randint(0, 23):02}:{random.randint(0, 59):02}:{random.randint(0, 59):02}"
+                  for _ in range(20_000)]
+    bench("parse_datetime", parse_datetime, dt_strings, chunk_size=500)
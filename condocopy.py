@@ -9,11 +9,17 @@ and manage concurrent file operations.
 import os
 import shutil
 import asyncio
+import time
 import aiofiles
-import win32file
-import win32con
 import psutil
 
+import profiler
+import verify
+from logger import error, info, warning
+from planner import (COPY, HISTORY_FILENAME, LINK, RENAME, SKIP, InsufficientSpaceError, OffloadPlan,
+                     ThroughputHistory, build_plan, check_free_space, upper_bound_bytes)
+from telemetry import FILE_FINISH, Telemetry, log_subscriber
+
 
 def read_file_list(filelist_path):
     with open(filelist_path, 'r') as f:
@@ -32,7 +38,45 @@ def choose_buffer_size(file_size):
         return 16 * 1024 * 1024  # 16 MB
 
 
+# Files from this size are read one at a time per source device (in sequential mode)
+LARGE_FILE_SIZE = 64 * 1024 * 1024
+
+
+def advise_sequential(fileno, file_size) -> None:
+    """Hint the kernel to read the whole file ahead sequentially (no-op where unsupported)"""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(fileno, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        os.posix_fadvise(fileno, 0, file_size, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass  # advice only
+
+
+def order_by_disk_layout(file_list) -> list:
+    """Order files as they are likely laid out on the card: directories in order of appearance,
+    files within a directory by inode (directory entry) number
+    """
+    d_dir_order = {}
+    keyed = []
+    for file_path in file_list:
+        dir_index = d_dir_order.setdefault(os.path.dirname(file_path), len(d_dir_order))
+        try:
+            inode = os.stat(file_path).st_ino
+        except OSError:
+            inode = 0
+        keyed.append((dir_index, inode, file_path))
+    keyed.sort()
+    return [file_path for _, _, file_path in keyed]
+
+
 def Win32_API_copy_file_times(src, dst):
+    if os.name != 'nt':
+        # No creation time to transfer, shutil.copystat() already copied a_time and m_time
+        return
+    import win32con
+    import win32file
+
     HANDLE_src_file = win32file.CreateFile(src, win32con.GENERIC_READ, 0, None,
                                            win32con.OPEN_EXISTING,
                                            win32con.FILE_ATTRIBUTE_NORMAL, None)
@@ -58,69 +102,141 @@ def Win32_API_copy_file_times(src, dst):
         HANDLE_dst_file.close()
 
 
-async def copy_file(src, dst, semaphore) -> None:
-    async with semaphore:  # Use semaphore to limit concurrency
-        file_size = os.path.getsize(src)
-        buffer_size = choose_buffer_size(file_size)
-
-        async with aiofiles.open(src, 'rb') as fsrc:
-            # REWRITE EXISTING mode
-            async with aiofiles.open(dst, 'wb') as fdst:
-                while True:
-                    data = await fsrc.read(buffer_size)
-                    if not data:
-                        break
-                    await fdst.write(data)
-
-        # Copy all possible file stats (including a_time and m_time)
-        shutil.copystat(src, dst)
-
-        # Explicit copy file times (c_time, a_time and m_time) by Win32_API
-        # this enshuring to be disabled further
-        Win32_API_copy_file_times(src, dst)
-
-
-def is_identical_file(src, dst):
-    """Compare src and dst file by plenty of characteristics"""
-
-    if not (os.path.exists(src) and os.path.exists(dst)):
-        return False
-    if os.path.getsize(src) != os.path.getsize(dst):
-        return False
-    if os.path.basename(src) != os.path.basename(dst):
-        return False
-
-    # Check only times using os.stat
-    src_stat = os.stat(src)
-    dst_stat = os.stat(dst)
-    if (src_stat.st_atime, src_stat.st_mtime, src_stat.st_ctime) != \
-            (dst_stat.st_atime, dst_stat.st_mtime, dst_stat.st_ctime):
-        return False
-
-    # Compare the first and last  n_to_compare  bytes
-    n_to_compare = 1024
-    with open(src, 'rb') as fsrc, open(dst, 'rb') as fdst:
-        # Directly compare first  n_to_compare  bytes
-        src_start = fsrc.read(n_to_compare)
-        fdst_start = fdst.read(n_to_compare)
-        if src_start != fdst_start:
-            return False
-
-        # Directly compare last  n_to_compare  bytes (if size allows)
-        if os.path.getsize(src) > n_to_compare:
-            fsrc.seek(-n_to_compare, os.SEEK_END)
-            fdst.seek(-n_to_compare, os.SEEK_END)
-
-            src_end = fsrc.read(n_to_compare)
-            fdst_end = fdst.read(n_to_compare)
-            if src_end != fdst_end:
-                return False
-
-    return True
-
+class TransferBudget:
+    """Bandwidth and buffer memory limits shared by all copy jobs running in one event loop
+
+    max_bytes_per_sec  - overall read rate (None - unlimited)
+    max_buffer_bytes  - overall size of the copy buffers in use (None - unlimited)
+    """
+
+    def __init__(self, max_bytes_per_sec=None, max_buffer_bytes=None):
+        self.max_bytes_per_sec = max_bytes_per_sec
+        self.max_buffer_bytes = max_buffer_bytes
+        self._next_slot = 0.0       # monotonic time when the next chunk may be transferred
+        self._buffer_used = 0
+        self._condition = None      # created in the running loop on first use
+
+    async def reserve_buffer(self, n_bytes: int) -> int:
+        """Wait until  n_bytes  of buffer memory are free and take them, return the reserved size"""
+        if self.max_buffer_bytes is None:
+            return n_bytes
+        n_bytes = min(n_bytes, self.max_buffer_bytes)
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._buffer_used + n_bytes <= self.max_buffer_bytes)
+            self._buffer_used += n_bytes
+        return n_bytes
+
+    async def release_buffer(self, n_bytes: int) -> None:
+        if self.max_buffer_bytes is None:
+            return
+        async with self._condition:
+            self._buffer_used -= n_bytes
+            self._condition.notify_all()
+
+    async def throttle(self, n_bytes: int) -> None:
+        """Delay the caller so the overall rate stays within  max_bytes_per_sec"""
+        if not self.max_bytes_per_sec:
+            return
+        now = time.monotonic()
+        slot = max(self._next_slot, now)
+        self._next_slot = slot + n_bytes / self.max_bytes_per_sec
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def remove_partial(dst) -> None:
+    try:
+        os.remove(dst)
+        info("Removed partial file: {}", os.path.basename(dst))
+    except OSError:
+        pass
+
+
+async def copy_file(src, dst, semaphore, telemetry: Telemetry = None, device=None,
+                    budget: TransferBudget = None, source_lock: asyncio.Lock = None) -> None:
+    """Copy the file reading the next chunk while the previous one is being written.
+    A  source_lock  (shared per source device) makes large files stream one at a time.
+    On failure or cancellation the partially written  dst  is deleted.
+    """
+    file_size = os.path.getsize(src)
+    if source_lock is not None and file_size >= LARGE_FILE_SIZE:
+        async with source_lock:
+            await copy_file(src, dst, semaphore, telemetry, device, budget)
+        return
 
-async def move_file(src, dst, semaphore) -> None:
-    await copy_file(src, dst, semaphore)
+    async with semaphore:  # Use semaphore to limit concurrency
+        with profiler.span("copy_file"):
+            buffer_size = choose_buffer_size(file_size)
+            # Read-ahead holds two chunks at once: the one being written and the one just read
+            reserved = 2 * buffer_size
+            if budget is not None:
+                reserved = await budget.reserve_buffer(reserved)
+                buffer_size = max(1, reserved // 2)
+
+            if telemetry is not None:
+                telemetry.file_started(device, src, file_size)
+            done_bytes = 0
+            pending_write = None
+            is_dst_created = False
+            try:
+                async with aiofiles.open(src, 'rb') as fsrc:
+                    advise_sequential(fsrc.fileno(), file_size)
+                    # REWRITE EXISTING mode
+                    async with aiofiles.open(dst, 'wb') as fdst:
+                        is_dst_created = True
+                        try:
+                            while True:
+                                data = await fsrc.read(buffer_size)
+                                if pending_write is not None:
+                                    await pending_write
+                                    pending_write = None
+                                if not data:
+                                    break
+                                if budget is not None:
+                                    await budget.throttle(len(data))
+                                # Write in background, the next chunk is read meanwhile
+                                pending_write = asyncio.ensure_future(fdst.write(data))
+                                if telemetry is not None:
+                                    done_bytes += len(data)
+                                    telemetry.file_chunk(device, src, len(data), done_bytes, file_size)
+                        finally:
+                            # A write in flight must end before the file gets closed
+                            if pending_write is not None:
+                                await asyncio.wait([pending_write])
+
+                # Copy all possible file stats (including a_time and m_time)
+                shutil.copystat(src, dst)
+
+                # Explicit copy file times (c_time, a_time and m_time) by Win32_API
+                # this enshuring to be disabled further
+                Win32_API_copy_file_times(src, dst)
+            except BaseException:
+                if is_dst_created:
+                    remove_partial(dst)
+                if telemetry is not None:
+                    telemetry.file_failed(device, src, done_bytes, file_size)
+                raise
+            finally:
+                if budget is not None:
+                    await budget.release_buffer(reserved)
+
+            if telemetry is not None:
+                telemetry.file_finished(device, src, file_size)
+
+
+@profiler.timed("is_identical_file")
+def is_identical_file(src, dst, depth: str = verify.SAMPLED):
+    """Compare src and dst file by plenty of characteristics (see  verify.verify_copy() ).
+    Names are not compared: the plan may give the copy a "(n)" suffix.
+    """
+    return verify.verify_copy(src, dst, depth)
+
+
+async def move_file(src, dst, semaphore, telemetry: Telemetry = None, device=None,
+                    budget: TransferBudget = None, source_lock: asyncio.Lock = None) -> None:
+    await copy_file(src, dst, semaphore, telemetry, device, budget, source_lock)
     # v-- blocking --v
     if is_identical_file(src, dst):
         os.remove(src)
@@ -181,40 +297,194 @@ def max_concurrent_copy_threads_algorithm(src_paths, dst_path):
     return base_count
 
 
-async def copy_files(file_list, dst_dir):
-    if not os.path.exists(dst_dir):
-        os.makedirs(dst_dir)
-
-    max_concurrent_copies = max_concurrent_copy_threads_algorithm(file_list, dst_dir)
+async def execute_plan(plan: OffloadPlan, move: bool = False, telemetry: Telemetry = None,
+                       metrics_file=None, budget: TransferBudget = None, sequential: bool = True,
+                       history: ThroughputHistory = None, dedup=None):
+    """Carry out the offload plan (copy, or move if  move  is set).
+    Written files are registered in the  dedup  index ( dedup.ContentIndex ) if given.
+
+    Files flow through a bounded queue to a fixed set of workers, so memory and open files
+    stay flat however long the plan is. A failing file does not stop the others: failures
+    are collected and returned as  [(PlanEntry, exception), ...] . On cancellation (e.g. the
+    card was removed) the workers stop and partially written files are deleted.
+    """
+    l_failures = []
+    if not plan.entries:
+        return l_failures
+    # Every target directory is created once, not checked per file
+    s_directories = {os.path.dirname(entry.target) for entry in plan if entry.action != SKIP}
+    for directory in sorted(s_directories):
+        os.makedirs(directory, exist_ok=True)
+    if telemetry is None:
+        telemetry = Telemetry()
+
+    l_entries = [entry for entry in plan if entry.action in (COPY, RENAME)]
+    l_linked = []
+    for entry in plan:
+        if entry.action != LINK:
+            continue
+        try:
+            os.link(entry.origin, entry.target)
+            l_linked.append(entry)
+        except OSError as e:
+            # Archive on another volume or without hard links: copy after all
+            warning("Hard link of {} failed ({}), copying instead", os.path.basename(entry.target), e)
+            l_entries.append(entry)
+    if move:
+        # Content is already archived: moving only means removing the source
+        await asyncio.to_thread(_remove_archived_sources, plan, set(l_linked))
+    if dedup is not None and l_linked:
+        await asyncio.to_thread(_register_in_index, dedup, l_linked)
+    if not l_entries:
+        return l_failures
+    telemetry.plan(plan.device, len(l_entries), sum(entry.size for entry in l_entries))
+
+    # Off the loop thread: the algorithm samples CPU load for a second
+    max_concurrent_copies = await asyncio.to_thread(max_concurrent_copy_threads_algorithm,
+                                                    [l_entries[0].source], plan.dst_dir)
     semaphore = asyncio.Semaphore(max_concurrent_copies)
-    tasks = []
-    for file_path in file_list:
-        if os.path.exists(file_path):
-            dst_path = os.path.join(dst_dir, os.path.basename(file_path))
-            tasks.append(copy_file(file_path, dst_path, semaphore))
-
-    await asyncio.gather(*tasks)
+    # Card friendly mode: large files streamed one at a time from the source
+    source_lock = asyncio.Lock() if sequential else None
+    offload_file = move_file if move else copy_file
+    queue = asyncio.Queue(maxsize=max_concurrent_copies * 2)
+    l_done = []
+
+    async def worker():
+        while (entry := await queue.get()) is not None:
+            try:
+                await offload_file(entry.source, entry.target, semaphore, telemetry, plan.device,
+                                   budget, source_lock)
+                l_done.append(entry)
+            except Exception as e:
+                error(f"Failed to offload {entry.source}: {e}")
+                l_failures.append((entry, e))
+
+    l_workers = [asyncio.create_task(worker()) for _ in range(max_concurrent_copies)]
+    started = time.monotonic()
+    try:
+        for entry in l_entries:
+            await queue.put(entry)
+        for _ in l_workers:
+            await queue.put(None)   # one stop mark per worker
+        await asyncio.gather(*l_workers)
+        if dedup is not None:
+            await asyncio.to_thread(_register_in_index, dedup, l_done)
+    except BaseException:
+        for task in l_workers:
+            task.cancel()
+        await asyncio.gather(*l_workers, return_exceptions=True)
+        raise
+    finally:
+        if history is not None:
+            # This run only: cumulative device stats would count idle time between jobs
+            history.record_run(plan.device, sum(entry.size for entry in l_done),
+                               time.monotonic() - started)
+        if metrics_file:
+            telemetry.dump_metrics(metrics_file)
+    return l_failures
+
+
+def _remove_archived_sources(plan: OffloadPlan, s_linked: set) -> None:
+    """Delete sources whose content is already in the archive, after reading the archived copy:
+    a dedup match found through the index is compared byte for byte (the archived file may
+    have been edited since it was hashed), a same-named target is verified as a copy
+    """
+    for entry in plan:
+        if not (entry.action == SKIP or entry in s_linked):
+            continue
+        if entry.origin is not None:
+            is_archived = verify.same_content(entry.source, entry.target)
+        else:
+            is_archived = is_identical_file(entry.source, entry.target)
+        if is_archived:
+            os.remove(entry.source)
+            info("Deleted already offloaded source file: {}", os.path.basename(entry.source))
+        else:
+            error("Archived copy of {} differs, the source is kept", entry.source)
 
 
-async def move_files(file_list, dst_dir):
-    if not os.path.exists(dst_dir):
-        os.makedirs(dst_dir)
+def _register_in_index(dedup, l_entries) -> None:
+    for entry in l_entries:
+        dedup.add(entry.target, entry.size)
+    dedup.save()
 
-    max_concurrent_copies = max_concurrent_copy_threads_algorithm(file_list, dst_dir)
-    semaphore = asyncio.Semaphore(max_concurrent_copies)
-    tasks = []
-    for file_path in file_list:
-        if os.path.exists(file_path):
-            dst_path = os.path.join(dst_dir, os.path.basename(file_path))
-            tasks.append(move_file(file_path, dst_path, semaphore))
 
-    await asyncio.gather(*tasks)
+def _has_entries(directory) -> bool:
+    try:
+        with os.scandir(directory) as it:
+            return next(it, None) is not None
+    except OSError:
+        return False
 
 
-# usage
-file_list, dst_dir = read_file_list('filelist.txt')
-if not (file_list and dst_dir):
-    quit(-1)
+async def plan_files(file_list, dst_dir, sequential: bool = True,
+                     history: ThroughputHistory = None, layout=None,
+                     dedup=None, dedup_mode: str = "skip", previous_targets: dict = None) -> OffloadPlan:
+    """Dry run: build the plan and refuse it right away if the destination lacks space.
 
-# asyncio.run(copy_files(file_list, dst_dir))
-asyncio.run(move_files(file_list, dst_dir))
+    The all-files-copied upper bound is checked first, before any metadata is read for the layout.
+    Only if it does not fit and something may be skipped (files already in the destination,
+    a dedup index, earlier targets) is the decision left to the full plan.
+    """
+    try:
+        await asyncio.to_thread(lambda: check_free_space(dst_dir, upper_bound_bytes(file_list)))
+    except InsufficientSpaceError:
+        if not (_has_entries(dst_dir) or (dedup is not None and len(dedup)) or previous_targets):
+            raise
+
+    def build():
+        l_files = order_by_disk_layout(file_list) if sequential else file_list
+        return build_plan(l_files, dst_dir, history=history, layout=layout,
+                          dedup=dedup, dedup_mode=dedup_mode, previous_targets=previous_targets)
+    plan = await asyncio.to_thread(build)
+    plan.check_space()
+    return plan
+
+
+async def copy_files(file_list, dst_dir, telemetry: Telemetry = None, metrics_file=None,
+                     budget: TransferBudget = None, sequential: bool = True,
+                     history: ThroughputHistory = None, layout=None,
+                     dedup=None, dedup_mode: str = "skip", previous_targets: dict = None):
+    history = history or ThroughputHistory(os.path.join(dst_dir, HISTORY_FILENAME))
+    plan = await plan_files(file_list, dst_dir, sequential, history, layout, dedup, dedup_mode,
+                            previous_targets)
+    return await execute_plan(plan, False, telemetry, metrics_file, budget, sequential, history, dedup)
+
+
+async def move_files(file_list, dst_dir, telemetry: Telemetry = None, metrics_file=None,
+                     budget: TransferBudget = None, sequential: bool = True,
+                     history: ThroughputHistory = None, layout=None,
+                     dedup=None, dedup_mode: str = "skip", previous_targets: dict = None):
+    history = history or ThroughputHistory(os.path.join(dst_dir, HISTORY_FILENAME))
+    plan = await plan_files(file_list, dst_dir, sequential, history, layout, dedup, dedup_mode,
+                            previous_targets)
+    return await execute_plan(plan, True, telemetry, metrics_file, budget, sequential, history, dedup)
+
+
+def first_copy_timer(started: float):
+    """Telemetry subscriber logging the time-to-first-copy (measured startup target) once"""
+    def on_event(event):
+        nonlocal started
+        if event.kind == FILE_FINISH and started is not None:
+            info(f"Time to first copy: {time.perf_counter() - started:.3f}s")
+            started = None
+    return on_event
+
+
+if __name__ == "__main__":
+    # usage
+    file_list, dst_dir = read_file_list('filelist.txt')
+    if not (file_list and dst_dir):
+        quit(-1)
+
+    cli_telemetry = Telemetry()
+    cli_telemetry.subscribe(log_subscriber)
+    cli_telemetry.subscribe(first_copy_timer(time.perf_counter()))
+    if profiler.is_cprofile_requested():
+        with profiler.profile_run('condocopy.pstats'):
+            asyncio.run(move_files(file_list, dst_dir, cli_telemetry, 'copy_metrics.json'))
+    else:
+        # asyncio.run(copy_files(file_list, dst_dir, cli_telemetry, 'copy_metrics.json'))
+        asyncio.run(move_files(file_list, dst_dir, cli_telemetry, 'copy_metrics.json'))
+    if profiler.is_enabled():
+        profiler.report()
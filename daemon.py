@@ -0,0 +1,194 @@
+"""
+Module provides the headless ingest daemon for machines without a desktop session.
+
+includes the daemon running the card monitor and the offload orchestrator in one asyncio loop,
+its local control socket with a line-delimited JSON API (status, progress, offload, cancel,
+shutdown), and the client helper used by scripts driving several cards at once.
+
+Request/response format (one JSON object per line) --v
+    -> {"cmd": "offload", "device": "/media/card1", "move": false}
+    <- {"ok": true, "jobs": {...}}
+    <- {"ok": false, "error": "Unknown device: /media/card9"}
+"""
+import argparse
+import asyncio
+import json
+import os
+
+from logger import error, info, warning
+from monitor import DirectoryDrivesProvider, RemovablesMonitor
+from orchestrator import OffloadOrchestrator
+from telemetry import Telemetry, log_subscriber, watch_stalls
+
+DEFAULT_SOCKET = os.path.join(os.path.expanduser("~"), ".condocopy.sock")
+DEFAULT_ROOT = os.path.join(os.path.expanduser("~"), "CondoCopy")
+
+
+class IngestDaemon:
+    """Card monitor + offload orchestrator controlled through a Unix socket
+
+    With  auto_offload  every attached card is offloaded right away, otherwise jobs are started
+    by the "offload" command. The monitor's  drives_provider, identify  and  match  callables
+    are passed through, so temporary directories can stand in for mounted cards.
+    """
+
+    def __init__(self, dst_root=DEFAULT_ROOT, socket_path=DEFAULT_SOCKET, auto_offload: bool = False,
+                 max_bytes_per_sec=None, workers: int = None, **monitor_kwargs):
+        self.socket_path = socket_path
+        self.auto_offload = auto_offload
+        self.telemetry = Telemetry()
+        self.telemetry.subscribe(log_subscriber)
+        self.orchestrator = OffloadOrchestrator(dst_root, self.telemetry, max_bytes_per_sec, workers=workers)
+        self.monitor = RemovablesMonitor(**monitor_kwargs)
+        self.monitor.on_attached(self.on_drive_attached)
+        self.monitor.on_detached(self.on_drive_detached)
+        self._server = None
+        self._stopped = None
+
+    def on_drive_attached(self, drive):
+        if self.auto_offload:
+            self.start_job(drive)
+
+    def on_drive_detached(self, drive):
+        self.orchestrator.cancel(drive['device'])
+
+    def start_job(self, drive, move: bool = False, incremental: bool = False):
+        job = self.orchestrator.add_job(drive['device'], drive['id'], drive['camera'], move, incremental,
+                                        self.monitor.d_scanners.get(drive['device']))
+        self.orchestrator.start()
+        return job
+
+    # === COMMANDS ===
+
+    def cmd_status(self) -> dict:
+        return {'cards': list(self.monitor.removables), 'jobs': self.orchestrator.status()}
+
+    def cmd_progress(self) -> dict:
+        return {'devices': self.telemetry.snapshot(), 'summary': self.telemetry.summary_text()}
+
+    def cmd_offload(self, device=None, move: bool = False, incremental: bool = False) -> dict:
+        """Offload the given card, all attached cards if  device  is omitted
+        ( incremental : only the files added since the previous incremental offload of the card)
+        """
+        if device is None:
+            l_drives = list(self.monitor.removables)
+        else:
+            drive = self.monitor.find(device)
+            if drive is None:
+                raise ValueError(f"Unknown device: {device}")
+            l_drives = [drive]
+        for drive in l_drives:
+            self.start_job(drive, move, incremental)
+        return {'jobs': self.orchestrator.status()}
+
+    def cmd_cancel(self, device) -> dict:
+        return {'cancelled': self.orchestrator.cancel(device)}
+
+    def cmd_shutdown(self) -> dict:
+        self._stopped.set()
+        return {}
+
+    def dispatch(self, d_request: dict) -> dict:
+        if not isinstance(d_request, dict):
+            return {'ok': False, 'error': f"Request must be a JSON object, got: {d_request!r}"}
+        d_request = dict(d_request)
+        command = getattr(self, f"cmd_{d_request.pop('cmd', '')}", None)
+        if command is None:
+            return {'ok': False, 'error': f"Unknown command: {d_request}"}
+        try:
+            return {'ok': True, **command(**d_request)}
+        except (TypeError, ValueError) as e:
+            return {'ok': False, 'error': str(e)}
+
+    async def handle_client(self, reader, writer) -> None:
+        try:
+            while line := await reader.readline():
+                try:
+                    d_response = self.dispatch(json.loads(line))
+                except ValueError as e:
+                    d_response = {'ok': False, 'error': f"Malformed request: {e}"}
+                writer.write(json.dumps(d_response, default=str).encode() + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass    # client went away, or the daemon is shutting down with the client connected
+        finally:
+            writer.close()
+
+    # === LIFE CYCLE ===
+
+    async def start(self) -> None:
+        if not hasattr(asyncio, 'start_unix_server'):
+            raise OSError("Unix sockets are not supported on this platform")
+        self._stopped = asyncio.Event()
+        if os.path.exists(self.socket_path):
+            try:
+                _, writer = await asyncio.open_unix_connection(self.socket_path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.remove(self.socket_path)     # left over by a killed daemon
+            else:
+                writer.close()
+                raise OSError(f"Another ingest daemon listens on {self.socket_path}")
+        self._server = await asyncio.start_unix_server(self.handle_client, self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        info(f"Ingest daemon listens on {self.socket_path}")
+
+    async def stop(self) -> None:
+        for device in list(self.orchestrator.jobs):
+            self.orchestrator.cancel(device)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+        self.orchestrator.dedup.save()
+        self.orchestrator.close()
+        info("Ingest daemon stopped")
+
+    async def serve(self) -> None:
+        """Run until the "shutdown" command (or cancellation)"""
+        await self.start()
+        monitor_task = asyncio.create_task(self.monitor.run())
+        stalls_task = asyncio.create_task(watch_stalls(self.telemetry))
+        try:
+            await self._stopped.wait()
+        finally:
+            monitor_task.cancel()
+            stalls_task.cancel()
+            await self.stop()
+
+
+async def request(socket_path=DEFAULT_SOCKET, cmd="status", **params) -> dict:
+    """Send a single command to a running daemon and return its response"""
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    try:
+        writer.write(json.dumps({'cmd': cmd, **params}).encode() + b'\n')
+        await writer.drain()
+        return json.loads(await reader.readline())
+    finally:
+        writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CondoCopy3 headless ingest daemon")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help="control socket path")
+    parser.add_argument('--root', default=DEFAULT_ROOT, help="offload archive root")
+    parser.add_argument('--auto', action='store_true', help="offload cards as soon as attached")
+    parser.add_argument('--workers', type=int, help="processes reading the cards while planning (at most 2)")
+    parser.add_argument('--cards-dir', help="treat subdirectories of this folder as mounted cards")
+    parser.add_argument('--send', metavar='CMD', help="send a command to the running daemon and exit")
+    parser.add_argument('--device', help="device of the --send command")
+    args = parser.parse_args()
+
+    if args.send:
+        d_params = {'device': args.device} if args.device else {}
+        print(json.dumps(asyncio.run(request(args.socket, args.send, **d_params)), indent=2))
+    else:
+        d_monitor = {'drives_provider': DirectoryDrivesProvider(args.cards_dir)} if args.cards_dir else {}
+        daemon = IngestDaemon(args.root, args.socket, args.auto, workers=args.workers, **d_monitor)
+        try:
+            asyncio.run(daemon.serve())
+        except KeyboardInterrupt:
+            warning("Ingest daemon interrupted")
+        except OSError as e:
+            error(f"Ingest daemon failed: {e}")
@@ -0,0 +1,165 @@
+"""
+Module provides the content-addressed deduplication index of the archive.
+
+includes the cheap partial fingerprint (size + hash of the first and last blocks), the full
+hash computed only when fingerprints collide, and the persisted index answering whether
+a file's content is already somewhere in the archive, across runs and cards.
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Optional
+
+from logger import debug, warning
+
+PARTIAL_BLOCK = 64 * 1024
+FULL_HASH_BLOCK = 1024 * 1024
+
+# Dedup modes --v
+DEDUP_SKIP = "skip"     # duplicates are not copied at all
+DEDUP_LINK = "link"     # duplicates are hard-linked to the archived copy
+
+
+def partial_hash(file_path, size: int) -> str:
+    """Hash of the first and the last  PARTIAL_BLOCK  bytes"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as file:
+        digest.update(file.read(PARTIAL_BLOCK))
+        if size > PARTIAL_BLOCK:
+            file.seek(max(size - PARTIAL_BLOCK, PARTIAL_BLOCK))
+            digest.update(file.read(PARTIAL_BLOCK))
+    return digest.hexdigest()
+
+
+def partial_key(file_path) -> str:
+    """Index key  "size:partial_hash"  of the file (process-pool stage)"""
+    size = os.path.getsize(file_path)
+    return f"{size}:{partial_hash(file_path, size)}"
+
+
+def full_hash(file_path) -> str:
+    digest = hashlib.blake2b()
+    with open(file_path, 'rb') as file:
+        while block := file.read(FULL_HASH_BLOCK):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ContentIndex:
+    """Persisted index  {"size:partial_hash": [{'path': str, 'size': int, 'mtime_ns': int,
+                                                 'full': Optional[str]}, ...]}
+
+    Lookups cost one partial hash (two small reads) of the new file, full hashes are computed
+    only for the files sharing that key and are stored so each archived file is hashed once,
+    unless its size or modification time changed since (edited in place).
+    """
+
+    def __init__(self, filename="content_index.json", executor=None):
+        self.filename = filename
+        self.executor = executor    # process pool of  prefetch()  (e.g.  workers.media_executor() )
+        self._lock = threading.Lock()
+        self._d_index = {}
+        self._d_keys = {}           # file path -> prefetched key
+        self._is_dirty = False
+        if filename and os.path.exists(filename):
+            try:
+                with open(filename, 'r', encoding='utf8') as file:
+                    self._d_index = json.load(file)
+            except (OSError, ValueError) as e:
+                warning(f"Content index {filename} is unreadable, starting empty: {e}")
+        # Kept up to date under the lock: counting  _d_index  on the loop thread could race
+        # with other jobs registering files from  asyncio.to_thread()
+        self._n_entries = sum(len(l_entries) for l_entries in self._d_index.values())
+
+    def __len__(self):
+        return self._n_entries
+
+    def _key(self, file_path, size: int) -> str:
+        key = self._d_keys.pop(file_path, None)
+        return key if key is not None else f"{size}:{partial_hash(file_path, size)}"
+
+    def prefetch(self, file_list) -> None:
+        """Compute the keys of the files about to be looked up all at once in the executor's
+        worker processes (full hashes are left to  find_duplicate() : most keys match no indexed file)
+        """
+        from workers import run_stage
+        for file_path, ok, key in run_stage(partial_key, file_list, self.executor):
+            if ok:
+                self._d_keys[file_path] = key
+
+    def forget_prefetched(self, file_list) -> None:
+        """Drop the prefetched keys of the files not looked up after all"""
+        for file_path in file_list:
+            self._d_keys.pop(file_path, None)
+
+    def find_duplicate(self, file_path, size: int = None) -> Optional[str]:
+        """Path of an archived file with the same content, None if there is none"""
+        size = os.path.getsize(file_path) if size is None else size
+        key = self._key(file_path, size)
+        with self._lock:
+            l_entries = self._d_index.get(key)
+            if not l_entries:
+                return None
+            own_full = None
+            for entry in list(l_entries):
+                try:
+                    stat = os.stat(entry['path'])
+                except OSError:
+                    l_entries.remove(entry)     # archived copy was deleted meanwhile
+                    self._n_entries -= 1
+                    self._is_dirty = True
+                    continue
+                if (stat.st_size, stat.st_mtime_ns) != (entry.get('size'), entry.get('mtime_ns')):
+                    # edited since it was hashed (or never hashed)
+                    entry['size'], entry['mtime_ns'], entry['full'] = stat.st_size, stat.st_mtime_ns, None
+                    self._is_dirty = True
+                if entry['size'] != size:
+                    continue
+                if entry['full'] is None:
+                    entry['full'] = full_hash(entry['path'])
+                own_full = own_full or full_hash(file_path)
+                if entry['full'] == own_full:
+                    debug("Duplicate content: {} == {}", file_path, entry['path'])
+                    return entry['path']
+        return None
+
+    def add(self, file_path, size: int = None) -> None:
+        """Register an archived file"""
+        size = os.path.getsize(file_path) if size is None else size
+        key = self._key(file_path, size)
+        with self._lock:
+            l_entries = self._d_index.setdefault(key, [])
+            if not any(entry['path'] == file_path for entry in l_entries):
+                l_entries.append({'path': file_path, 'size': None, 'mtime_ns': None, 'full': None})
+                self._n_entries += 1
+                self._is_dirty = True
+
+    def index_directory(self, root) -> int:
+        """Register every file under  root  (e.g. an existing archive), return their number"""
+        n_files = 0
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                file_path = os.path.join(directory, filename)
+                if file_path == self.filename:
+                    continue
+                try:
+                    self.add(file_path)
+                    n_files += 1
+                except OSError as e:
+                    warning(f"Unable to index {file_path}: {e}")
+        return n_files
+
+    def save(self) -> None:
+        with self._lock:
+            if not (self.filename and self._is_dirty):
+                return
+            tmp_filename = self.filename + '.tmp'
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.filename)), exist_ok=True)
+                with open(tmp_filename, 'w', encoding='utf8') as file:
+                    json.dump(self._d_index, file, separators=(',', ':'))
+                os.replace(tmp_filename, self.filename)
+                self._is_dirty = False
+            except OSError as e:
+                warning(f"Unable to save content index to {self.filename}: {e}")
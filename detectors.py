@@ -3,17 +3,19 @@ Module provides functionality to detect removables and match theis dir structure
 
 """
 import ctypes
+import json
 import os
+import re
+import threading
 import zlib
-from collections import Counter
+from collections import Counter, namedtuple
 from datetime import datetime
 from typing import Optional, Tuple
 
-import numpy as np
 import psutil
-import toml
 
-from initialization import d_cameras
+from logger import debug, warning
+from profiler import timed
 
 
 async def get_removable_drives() -> list:
@@ -22,8 +24,14 @@ async def get_removable_drives() -> list:
     return removable_drives
 
 
-def get_directories(start_path) -> list:
-    """Get a list of related directories for the given path"""
+@timed("get_directories")
+def get_directories(start_path, scanner=None) -> list:
+    """Get a list of related directories for the given path
+    (from the snapshot of  scanner.IncrementalScanner  of the path if given, updated first)
+    """
+    if scanner is not None:
+        scanner.scan()
+        return scanner.directories()
     apath = os.path.abspath(start_path)
     rel_directories = []
     for root, dirs, files in os.walk(apath):
@@ -43,9 +51,13 @@ def calculate_weights(cameras_data) -> dict[str, float]:
     return token_weights
 
 
-def match_camera_model(sd_path, cameras: dict) -> Optional[str]:
-    """Matches the SD card structure to a camera model"""
-    s_sd_directories = set(get_directories(sd_path))
+def match_camera_model(sd_path, cameras: dict, scanner=None) -> Optional[str]:
+    """Matches the SD card structure to a camera model
+    (re-matches of an attached card pass its  scanner.IncrementalScanner  to skip the full walk)
+    """
+    import numpy as np  # heavy, loaded on the first match only
+
+    s_sd_directories = set(get_directories(sd_path, scanner))
 
     # Filtering camera models that have all directories present on the given SD card
     relevant_models = {}
@@ -151,7 +163,194 @@ def get_folder_creation_date(path):
         return ""
 
 
-def generate_id(drive):
+# VolumeInfo format --v
+# VolumeInfo(label: str, serial: str, total_size: int)
+VolumeInfo = namedtuple("VolumeInfo", "label serial total_size")
+
+
+class Kernel32VolumeProvider:
+    """Volume information of a Windows drive letter via kernel32"""
+
+    def volume_info(self, drive) -> VolumeInfo:
+        return VolumeInfo(*get_volume_info_kernel32(drive))
+
+
+def _unescape_octal_hex(value: str) -> str:
+    """Decode '\\040' (/proc/mounts) and '\\x20' (udev links) escapes keeping UTF-8 intact"""
+    def to_byte(match):
+        code = match.group(1)
+        return bytes([int(code[1:], 16) if code.startswith(b'x') else int(code, 8)])
+    return re.sub(rb'\\(x[0-9a-fA-F]{2}|[0-7]{3})', to_byte, value.encode()).decode('utf8', 'replace')
+
+
+class LinuxVolumeProvider:
+    """Volume information of a Linux mount point: filesystem UUID and label are found among
+    /dev/disk/by-uuid and /dev/disk/by-label symlinks of the mounted device, size by statvfs
+    """
+
+    def __init__(self, disk_dir="/dev/disk", mounts_filename="/proc/mounts"):
+        self.disk_dir = disk_dir
+        self.mounts_filename = mounts_filename
+
+    def _mounted_device(self, mountpoint) -> Optional[str]:
+        mountpoint = os.path.realpath(mountpoint)
+        try:
+            with open(self.mounts_filename, 'r') as file:
+                for line in file:
+                    fields = line.split()
+                    # Octal escapes (e.g. '\040' for spaces) are used in /proc/mounts
+                    if len(fields) > 1 and _unescape_octal_hex(fields[1]) == mountpoint:
+                        return os.path.realpath(fields[0])
+        except OSError:
+            pass
+        return None
+
+    def _link_name_of(self, kind, device) -> str:
+        links_dir = os.path.join(self.disk_dir, kind)
+        try:
+            for name in os.listdir(links_dir):
+                if os.path.realpath(os.path.join(links_dir, name)) == device:
+                    # udev escapes spaces and slashes in labels
+                    return _unescape_octal_hex(name)
+        except OSError:
+            pass
+        return ""
+
+    def volume_info(self, drive) -> VolumeInfo:
+        try:
+            st = os.statvfs(drive)
+            total_size = st.f_blocks * st.f_frsize
+        except OSError:
+            total_size = 0
+        device = self._mounted_device(drive)
+        if device is None:
+            return VolumeInfo("NO_LABEL", "", total_size)
+        label = self._link_name_of("by-label", device) or "NO_LABEL"
+        serial = self._link_name_of("by-uuid", device).replace("-", "").upper()
+        return VolumeInfo(label, serial, total_size)
+
+
+class StaticVolumeProvider:
+    """Stand-in provider for tests: volume information given as  {mountpoint: VolumeInfo}"""
+
+    def __init__(self, d_volumes: dict):
+        self.d_volumes = d_volumes
+
+    def volume_info(self, drive) -> VolumeInfo:
+        return self.d_volumes.get(drive, VolumeInfo("NO_LABEL", "", 0))
+
+
+def default_volume_provider():
+    return Kernel32VolumeProvider() if os.name == 'nt' else LinuxVolumeProvider()
+
+
+def compose_id(volume: VolumeInfo, str_creation_dates: str) -> str:
+    """Compose "VOLUME_LABEL_HASH_SUFFIX" ID (see  generate_id() )"""
+    # Create the string to be hashed and calculate its CRC32 checksum
+    combined_str = f"{volume.label}{volume.serial}{volume.total_size}{str_creation_dates}"
+    crc32_hash = zlib.crc32(combined_str.encode())
+    # use six first chars
+    hash_suffix = f"{crc32_hash:08x}"[:6].upper()
+
+    # compose and return ID
+    return f"{volume.label}_{hash_suffix}"
+
+
+class DriveIdentityRegistry:
+    """Drive IDs memoized per mount point for the session and persisted across sessions.
+
+    A volume seen before (same label, serial and size) gets its stored ID without any probes
+    of the drive's tree, the folders' creation dates are read only for a never seen volume.
+    Volumes without a serial are never matched by history, they are too easy to confuse.
+    """
+
+    # Folders which creation dates to be used as unique marks  (if exists and available)
+    distinst_folders = ("DCIM", "MISC", "Android")
+
+    def __init__(self, provider=None, filename="known_drives.json"):
+        self.provider = provider or default_volume_provider()
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._by_mount = {}     # mountpoint -> drive ID (this session)
+        self._known = None      # volume key -> {'id', 'first_seen', 'last_seen', 'insertions'}
+
+    @staticmethod
+    def volume_key(volume: VolumeInfo) -> Optional[str]:
+        return f"{volume.label}|{volume.serial}|{volume.total_size}" if volume.serial else None
+
+    def _load(self) -> dict:
+        if self._known is None:
+            self._known = {}
+            if self.filename and os.path.exists(self.filename):
+                try:
+                    with open(self.filename, 'r', encoding='utf8') as file:
+                        self._known = json.load(file)
+                except (OSError, ValueError) as e:
+                    warning(f"Known drives file {self.filename} is unreadable: {e}")
+        return self._known
+
+    def _save(self) -> None:
+        if not self.filename:
+            return
+        tmp_filename = self.filename + '.tmp'
+        try:
+            with open(tmp_filename, 'w', encoding='utf8') as file:
+                json.dump(self._known, file, indent=1)
+            os.replace(tmp_filename, self.filename)
+        except OSError as e:
+            warning(f"Unable to save known drives to {self.filename}: {e}")
+
+    def identify(self, drive) -> str:
+        with self._lock:
+            drive_id = self._by_mount.get(drive)
+            if drive_id is not None:
+                return drive_id
+
+            volume = self.provider.volume_info(drive)
+            key = self.volume_key(volume)
+            d_known = self._load()
+            now = datetime.now().strftime('%Y%m%d_%H%M%S')
+            if key is not None and key in d_known:
+                entry = d_known[key]
+                entry['last_seen'] = now
+                entry['insertions'] += 1
+                debug(f"Known drive {entry['id']} (insertion #{entry['insertions']})")
+            else:
+                str_creation_dates = "".join([get_folder_creation_date(os.path.join(drive, folder))
+                                              for folder in self.distinst_folders])
+                entry = {'id': compose_id(volume, str_creation_dates),
+                         'first_seen': now, 'last_seen': now, 'insertions': 1}
+                if key is not None:
+                    d_known[key] = entry
+            self._save()
+
+            self._by_mount[drive] = entry['id']
+            return entry['id']
+
+    def forget(self, drive) -> None:
+        """Drop the session memo of a disconnected mount point"""
+        with self._lock:
+            self._by_mount.pop(drive, None)
+
+    def history(self, drive_id) -> Optional[dict]:
+        with self._lock:
+            for entry in self._load().values():
+                if entry['id'] == drive_id:
+                    return dict(entry)
+        return None
+
+
+_default_registry = None
+
+
+def get_identity_registry() -> DriveIdentityRegistry:
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = DriveIdentityRegistry()
+    return _default_registry
+
+
+def generate_id(drive, registry: DriveIdentityRegistry = None):
     """Generates a unique ID for a drive based on its volume information and
      creation dates of specific folders (if presented on drive and available to retrieve).
 
@@ -164,20 +363,8 @@ def generate_id(drive):
     4. Calculate the CRC32 checksum of the combined string
     5. Use the first six characters of the CRC32 checksum (in uppercase) as a suffix for the ID
     6. Compose the final ID in the format "VOLUME_LABEL_HASH_SUFFIX".
-    """
-
-    # Folders which creation dates to be used as unique marks  (if exists and available)
-    distinst_folders = ("DCIM", "MISC", "Android")
-
-    volume_label, volume_serial, total_size = get_volume_info_kernel32(drive)
-    str_creation_dates = "".join([get_folder_creation_date(os.path.join(drive, folder))
-                                  for folder in distinst_folders])
 
-    # Create the string to be hashed and calculate its CRC32 checksum
-    combined_str = f"{volume_label}{volume_serial}{total_size}{str_creation_dates}"
-    crc32_hash = zlib.crc32(combined_str.encode())
-    # use six first chars
-    hash_suffix = f"{crc32_hash:08x}"[:6].upper()
-
-    # compose and return ID
-    return f"{volume_label}_{hash_suffix}"
+    Known volumes and already identified mount points are answered by the  registry
+    (the default one if omitted) without repeating the steps above.
+    """
+    return (registry or get_identity_registry()).identify(drive)
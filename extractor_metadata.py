@@ -7,18 +7,20 @@ and generate new filenames with compact date/time format as a prefix.
 """
 
 import os
-from pymediainfo import MediaInfo
 from datetime import datetime
-import piexif
 
 from compact_datetime import dtstring_to_compactformat
+from profiler import timed
 
 
+@timed("get_file_type")
 def get_file_type(file_path) -> str:
     """Determine if the file is image, video, audio, or other type using MediaInfo
 
     :return: str  in  ( 'Image', 'Video', 'Audio', 'Other' )
     """
+    from pymediainfo import MediaInfo  # loaded on first use
+
     minf = MediaInfo.parse(file_path)
     for track in minf.tracks:
         # Return first specific track found
@@ -32,12 +34,16 @@ def get_file_type(file_path) -> str:
     return "Other"
 
 
+@timed("extract_key_datetime")
 def extract_key_datetime(file_path):
     """Extract key date/time from the metadata of image or video file, if available.
     Usually 'taken', 'encoded', or 'modified' date/time
 
     :return: Key date/time in YYYYMMDD_HHMMSS compact format, otherwise None
     """
+    import piexif  # loaded on first use
+    from pymediainfo import MediaInfo
+
     if not os.path.isfile(file_path):
         # The file does not exist or is a directory
         return None
@@ -83,6 +89,7 @@ def extract_key_datetime(file_path):
     return None
 
 
+@timed("generate_new_filename")
 def generate_new_filename(file_path):
     """Generates a new filename based on the taken date or last modification date.
 
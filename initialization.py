@@ -1,12 +1,14 @@
+import hashlib
+import json
 import os
-
-import toml
+import threading
 
 from logger import debug, error, info, omit, success, trace, warning
 
 
 def load_cameras(toml_filename) -> dict:
     """Load and validate cameras' "footprints" from a .toml file"""
+    import toml  # loaded on first use
 
     def ensure_pathlist(inlist: list) -> list:
         try:
@@ -39,5 +41,98 @@ def load_cameras(toml_filename) -> dict:
         raise
 
 
-d_cameras = load_cameras('cameras.toml')
-success("'cameras.toml' loaded successfully.")
+CACHE_VERSION = 1
+
+
+def _file_digest(filename) -> str:
+    with open(filename, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+def load_cameras_cached(toml_filename, cache_filename=None) -> dict:
+    """Load cameras' "footprints" from the compiled JSON snapshot of the .toml file.
+
+    The snapshot keeps already normalized structures and is rebuilt only when the .toml file
+    changes: mtime and size are checked first, the content hash only if those differ.
+    """
+    cache_filename = cache_filename or os.path.splitext(toml_filename)[0] + '.cache.json'
+    if not os.path.exists(toml_filename):
+        error(f"File not found: {toml_filename}")
+        raise FileNotFoundError(f"{toml_filename} does not exist")
+    toml_stat = os.stat(toml_filename)
+
+    d_cache = None
+    try:
+        with open(cache_filename, 'r', encoding='utf8') as file:
+            d_cache = json.load(file)
+        if d_cache.get('version') != CACHE_VERSION:
+            d_cache = None
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        warning(f"Camera cache {cache_filename} is unreadable, rebuilding: {e}")
+
+    if d_cache is not None:
+        if (d_cache['mtime_ns'], d_cache['size']) == (toml_stat.st_mtime_ns, toml_stat.st_size):
+            debug(f"Cameras loaded from cache {cache_filename}")
+            return d_cache['cameras']
+        digest = _file_digest(toml_filename)
+        if d_cache['sha1'] == digest:
+            # Touched but not changed: keep the snapshot, refresh its stamps
+            _write_camera_cache(cache_filename, d_cache['cameras'], toml_stat, digest)
+            return d_cache['cameras']
+    else:
+        digest = _file_digest(toml_filename)
+
+    d_cameras = load_cameras(toml_filename)
+    _write_camera_cache(cache_filename, d_cameras, toml_stat, digest)
+    info(f"Camera cache {cache_filename} rebuilt")
+    return d_cameras
+
+
+def _write_camera_cache(cache_filename, d_cameras: dict, toml_stat, digest: str) -> None:
+    d_cache = {'version': CACHE_VERSION,
+               'mtime_ns': toml_stat.st_mtime_ns,
+               'size': toml_stat.st_size,
+               'sha1': digest,
+               'cameras': d_cameras}
+    tmp_filename = cache_filename + '.tmp'
+    try:
+        with open(tmp_filename, 'w', encoding='utf8') as file:
+            json.dump(d_cache, file, separators=(',', ':'))
+        os.replace(tmp_filename, cache_filename)
+    except OSError as e:
+        # Cache is an optimization only: a read-only install still works from the .toml
+        warning(f"Unable to write camera cache {cache_filename}: {e}")
+
+
+# Next to the module, not in the CWD: the daemon may be started from anywhere
+CAMERAS_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cameras.toml')
+
+_d_cameras = None
+_cameras_lock = threading.Lock()
+
+
+def get_cameras() -> dict:
+    """Cameras' "footprints", loaded once on the first call (or by  preload_cameras() )"""
+    global _d_cameras
+    if _d_cameras is None:
+        with _cameras_lock:
+            if _d_cameras is None:
+                _d_cameras = load_cameras_cached(CAMERAS_FILENAME)
+                success(f"'{CAMERAS_FILENAME}' loaded successfully.")
+    return _d_cameras
+
+
+def preload_cameras() -> threading.Thread:
+    """Load cameras' "footprints" in a background thread, so startup does not wait for it"""
+    thread = threading.Thread(target=get_cameras, name="preload_cameras", daemon=True)
+    thread.start()
+    return thread
+
+
+def __getattr__(name):
+    # Backward compatible lazy  `from initialization import d_cameras`
+    if name == 'd_cameras':
+        return get_cameras()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
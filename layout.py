@@ -0,0 +1,64 @@
+"""
+Module provides the date-bucketed destination layout of the archive.
+
+includes the key datetime resolver of a file (metadata first, modification time otherwise),
+and the layout engine mapping compact datetimes to  YYYY/YYYY-MM-DD/  folders with the path
+of every date computed once (the planner lists and  execute_plan()  creates each folder once).
+"""
+import os
+from typing import Optional
+
+from compact_datetime import dtstring_to_compactformat
+
+
+def compact_key_datetime(file_path) -> Optional[str]:
+    """Key date/time of the file in YYYYMMDD_HHMMSS compact format, modification time as fallback"""
+    from extractor_metadata import extract_key_datetime
+    try:
+        compact = dtstring_to_compactformat(extract_key_datetime(file_path))
+    except Exception:
+        compact = None  # unreadable metadata is not a reason to lose the file's date
+    if compact is None:
+        try:
+            compact = dtstring_to_compactformat(os.path.getmtime(file_path))
+        except OSError:
+            compact = None
+    return compact
+
+
+class DateLayout:
+    """Archive layout  <root>/YYYY/YYYY-MM-DD/<file> , undated files go to  <root>/<undated_dir>"""
+
+    def __init__(self, root, undated_dir: str = "Undated", executor=None):
+        self.root = root
+        self.undated_dir = undated_dir
+        self.executor = executor    # process pool of  resolve()  (e.g.  workers.media_executor() )
+        self.d_datetimes = {}   # file path -> compact datetime (or None)
+        self._d_dirs = {}       # date part 'YYYYMMDD' -> target directory
+
+    def resolve(self, file_list) -> None:
+        """Find key datetimes of all files at once, in the executor's worker processes
+        unless there is none or the files are too few to pay for the round trip
+        """
+        from workers import run_stage
+        l_pending = [file_path for file_path in file_list if file_path not in self.d_datetimes]
+        if not l_pending:
+            return
+        # Failed items stay undated
+        for file_path, ok, compact in run_stage(compact_key_datetime, l_pending, self.executor):
+            self.d_datetimes[file_path] = compact if ok else None
+
+    def target_dir(self, compact_datetime: Optional[str]) -> str:
+        if not compact_datetime:
+            return os.path.join(self.root, self.undated_dir)
+        date_part = compact_datetime[:8]
+        target = self._d_dirs.get(date_part)
+        if target is None:
+            year, month, day = date_part[:4], date_part[4:6], date_part[6:8]
+            target = self._d_dirs[date_part] = os.path.join(self.root, year, f"{year}-{month}-{day}")
+        return target
+
+    def target_dir_of(self, file_path) -> str:
+        if file_path not in self.d_datetimes:
+            self.d_datetimes[file_path] = compact_key_datetime(file_path)
+        return self.target_dir(self.d_datetimes[file_path])
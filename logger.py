@@ -1,5 +1,8 @@
+import os
 import sys
-from functools import partial
+import threading
+import time
+from functools import lru_cache, partial
 
 from loguru import logger
 
@@ -7,27 +10,135 @@ from loguru import logger
 scenario = "ALL"    # "ALL" , "FILE_ONLY" , "STDOUTPUT_ONLY" accepted
 level = "TRACE"  # "OMIT", "TRACE", "DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR" ("CRITICAL")
 enqueue = True
+# Per-module levels, e.g.  CONDOCOPY_LOG_LEVELS="condocopy=INFO,main=DEBUG"
+module_levels = dict(item.split("=", 1)
+                     for item in os.environ.get("CONDOCOPY_LOG_LEVELS", "").split(",") if "=" in item)
+# Batched file sink flushing thresholds
+batch_max_bytes = 64 * 1024
+batch_interval = 1.0
 
-# Customization
-logger.remove(None)
+FILE_FORMAT = "{time} | {level: <8} | {name: ^15} | {function: ^15} | {line: >3} | {message}"
+STDOUT_FORMAT = ("<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | "
+                 "<level>{level: <8}</level> | "
+                 "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>")
+
+
+class BatchedFileSink:
+    """File sink collecting formatted messages in memory and writing them in batches,
+    when  max_bytes  are buffered or  interval  seconds passed since the last write.
+
+    There is deliberately no  flush()  method: loguru calls it after every message.
+    """
+
+    def __init__(self, filename, max_bytes: int = batch_max_bytes, interval: float = batch_interval,
+                 encoding="utf8"):
+        self._file = open(filename, 'a', encoding=encoding)
+        self._max_bytes = max_bytes
+        self._interval = interval
+        self._buffer = []
+        self._buffered = 0
+        self._last_write = time.monotonic()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        # Idle flusher: buffered messages reach the disk even if logging goes quiet
+        self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+
+    def write(self, message) -> None:
+        with self._lock:
+            self._buffer.append(message)
+            self._buffered += len(message)
+            if self._buffered >= self._max_bytes or \
+                    time.monotonic() - self._last_write >= self._interval:
+                self._write_buffer()
+
+    def _write_buffer(self) -> None:
+        if self._buffer:
+            self._file.write("".join(self._buffer))
+            self._file.flush()
+            self._buffer.clear()
+            self._buffered = 0
+        self._last_write = time.monotonic()
+
+    def _flush_periodically(self) -> None:
+        while not self._stopped.wait(self._interval):
+            with self._lock:
+                self._write_buffer()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        with self._lock:
+            self._write_buffer()
+            self._file.close()
+
+
+@lru_cache(maxsize=None)
+def _level_no(level_name) -> int:
+    return logger.level(level_name).no
 
+
+def _module_filter(record) -> bool:
+    """Apply per-module levels (the module's own or its package's entry, global level otherwise)"""
+    name = record["name"] or ""
+    while True:
+        if name in module_levels:
+            return record["level"].no >= _level_no(module_levels[name])
+        if "." not in name:
+            return record["level"].no >= _level_no(level)
+        name = name.rsplit(".", 1)[0]
+
+
+def configure() -> None:
+    """(Re)create the sinks for the current  scenario, level  and  module_levels.
+
+    Sinks accept from the lowest configured level so loguru still rejects every message below
+    all configured levels before formatting it, the per-module decision is made by the filter.
+    """
+    min_level = min([level, *module_levels.values()], key=_level_no)
+    logger.remove(None)
+    if scenario in ("FILE_ONLY", "ALL"):
+        logger.add(BatchedFileSink("event_log.log"),
+                   format=FILE_FORMAT,
+                   filter=_module_filter,
+                   enqueue=enqueue,
+                   level=min_level)
+    if scenario in ("STDOUTPUT_ONLY", "ALL"):
+        logger.add(sys.stdout,
+                   format=STDOUT_FORMAT,
+                   filter=_module_filter,
+                   enqueue=enqueue,
+                   level=min_level)
+
+
+def set_level(new_level: str, module: str = None) -> None:
+    """Change the global level or (if  module  is given) the level of one module at runtime.
+    Passing  new_level=None  with a module drops its override.
+    """
+    global level
+    if module is None:
+        level = new_level
+    elif new_level is None:
+        module_levels.pop(module, None)
+    else:
+        module_levels[module] = new_level
+    configure()
+
+
+def is_enabled(level_name: str, module: str = None) -> bool:
+    """Cheap check to guard expensive log-only computations"""
+    threshold = module_levels.get(module, level) if module else min([level, *module_levels.values()],
+                                                                    key=_level_no)
+    return _level_no(level_name) >= _level_no(threshold)
+
+
+# Customization
 logger.level("OMIT", no=1, color="<light-black>", icon="_")  # Custom level for excluded log-events
-if scenario in ("FILE_ONLY", "ALL"):
-    logger.add("event_log.log",
-               encoding="utf8",
-               format="{time} | {level: <8} | {name: ^15} | {function: ^15} | {line: >3} | {message}",
-               enqueue=enqueue,
-               level=level)
-if scenario in ("STDOUTPUT_ONLY", "ALL"):
-    logger.add(sys.stdout,
-               format="<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | "
-                      "<level>{level: <8}</level> | "
-                      "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-               enqueue=enqueue,
-               level=level)
+logger.level("PROFILE", no=15, color="<magenta>", icon="~")  # Custom level for profiler timings
+configure()
 
 # Aliases
 omit = partial(logger.log, "OMIT")
+profile = partial(logger.log, "PROFILE")
 trace = logger.trace
 debug = logger.debug
 info = logger.info
@@ -37,3 +148,7 @@ error = logger.error
 
 # Use ALL:
 # from logger import omit, trace, debug, info, success, warning, error
+#
+# Lazy formatting: pass arguments instead of an f-string, so the (possibly expensive) str()
+# is only computed when a sink accepts the message --v
+# trace("deque_removables = {}", deque_removables)
@@ -2,22 +2,33 @@
 CondoCopy3 v0.0
 
 """
+import time
+_t_launch = time.perf_counter()  # tray time-to-visible is measured from here
+
 import asyncio
+import os
 import sys
 from collections import deque
 
 from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QCursor, QIcon
-from PyQt5.QtWidgets import (QAction, QApplication, QDialog, QLabel, QMenu,
+from PyQt5.QtGui import QCursor, QIcon, QImage, QPixmap
+from PyQt5.QtWidgets import (QAction, QApplication, QDialog, QGridLayout, QLabel, QMenu,
                              QPushButton, QSystemTrayIcon, QVBoxLayout)
 
 from logger import debug, error, info, omit, success, trace, warning
-from initialization import d_cameras
-from detectors import get_removable_drives, generate_id, match_camera_model
+from initialization import preload_cameras
+from monitor import RemovablesMonitor
+from telemetry import Telemetry, log_subscriber, watch_stalls
+from orchestrator import OffloadOrchestrator, collect_card_files
+from previews import PreviewCache, latest_shots
+import profiler
+
+# Root of the offload archive (per camera / per card folders are created inside)
+OFFLOAD_ROOT = os.path.join(os.path.expanduser("~"), "CondoCopy")
 
 
 # deque_removables format --v
-# deque([{'device': str(drive), 'id': str(drive_id)}, ... ])
+# deque([{'device': str(drive), 'id': str(drive_id), 'camera': Optional[str]}, ... ])
 deque_removables = deque()
 
 
@@ -31,6 +42,9 @@ class TrayApp:
         self.tray_icon = QSystemTrayIcon(QIcon("icon1.png"), self.parent_app_)
         # Create a context menu
         self.menu = QMenu()
+        self.action_offload = QAction("Offload all cards")
+        self.action_offload.triggered.connect(self.on_offload_all)
+        self.menu.addAction(self.action_offload)
         self.action_quit = QAction("Quit")
         self.action_quit.triggered.connect(self.exit)
         self.menu.addAction(self.action_quit)
@@ -40,6 +54,9 @@ class TrayApp:
         self.tray_icon.activated.connect(self.on_tray_icon_activated)
         # Show the tray icon
         self.tray_icon.show()
+        info(f"Tray time-to-visible: {time.perf_counter() - _t_launch:.3f}s")
+        # Cameras' "footprints" are needed on the first insertion only
+        preload_cameras()
 
         ## === ASYNC LOOP ===
         # Initialize the asyncio event loop
@@ -50,48 +67,41 @@ class TrayApp:
         ## === VARS ===
         self.last_drive_list = []
 
+        ## === TELEMETRY ===
+        # Copy progress events are shown in the tray tooltip and logged
+        self.telemetry = Telemetry()
+        self.telemetry.subscribe(log_subscriber)
+        self.telemetry.subscribe(self.on_progress_event)
+
+        ## === OFFLOAD ===
+        # All attached cards are drained in parallel under one shared budget
+        self.orchestrator = OffloadOrchestrator(OFFLOAD_ROOT, self.telemetry)
+
+        ## === PREVIEWS ===
+        # Embedded thumbnails of the cards' latest shots, kept while the app runs
+        self.previews = PreviewCache()
+        self.dialog = None
+
+        ## === MONITOR ===
+        self.monitor = RemovablesMonitor(removables=deque_removables)
+        self.monitor.on_detached(self.on_drive_detached)
+        self.monitor.on_updated(lambda _: self.refresh_display_atask())
+
     def run(self):
         # Schedule the monitoring task
         self._loop.create_task(self.monitor_removables_atask())
+        # Stalled cards send no progress events: checked on a timer
+        self._loop.create_task(watch_stalls(self.telemetry))
         # Run the Qt application and asyncio event loop together
         self._loop.run_until_complete(self.qt_life_cycle_atask())
 
     async def monitor_removables_atask(self):
-        while True:
-            # detect current
-            set_current_removables = set(await get_removable_drives())
-            # retrieve last
-            set_last_removables = {drive['device'] for drive in deque_removables}
-            # suppose no changes
-            is_updated = False
-
-            # Check for new connected removables
-            for drive in set_current_removables - set_last_removables:
-                drive_id = generate_id(drive)
-                camera_model = match_camera_model(drive, d_cameras)
-
-                # todo add camera_model to deque_removables
-
-                # deque_removables format --v
-                # deque([{'device': str(drive), 'id': str(drive_id)}, ... ])
-                deque_removables.append({'device': drive, 'id': drive_id})
-
-                success(f"The removable is matched with: {camera_model}")
-                is_updated = True
-
-            # Check for disconnected drives
-            for drive in list(deque_removables):
-                if drive['device'] not in set_current_removables:
-                    deque_removables.remove(drive)
-                    success(f"The removable [{drive['id']}] was disconnected")
-                    is_updated = True
-
-            # Handle changes in  deque_removables
-            trace(f"{deque_removables = }")
-            if is_updated:
-                await self.refresh_display_atask()
-
-            await asyncio.sleep(1)
+        # Detection loop is shared with the headless daemon
+        await self.monitor.run()
+
+    def on_drive_detached(self, drive):
+        self.previews.forget_card(drive['id'])
+        self.orchestrator.cancel(drive['device'])
 
     async def qt_life_cycle_atask(self):
         # Run the Qt application intertnal events until the application quits
@@ -101,18 +111,42 @@ class TrayApp:
             await asyncio.sleep(0.1)
 
     async def refresh_display_atask(self):
-        # Show dialog window
-
-        # placeholder for display logic
-        # todo display logic
-        #
-        # kinda    -->     f"{drive['device']} (Removable) ID: {drive['id']}"
-        dialog = SDCardDialog('A:')
-        dialog.setWindowModality(Qt.NonModal)
-        dialog.show()
-
+        # Show dialog window of the latest attached card
+        if not deque_removables:
+            return
+        drive = deque_removables[-1]
+        if self.dialog is not None:
+            self.dialog.close()
+        self.dialog = SDCardDialog(f"{drive['device']} (Removable) ID: {drive['id']}")
+        self.dialog.setWindowModality(Qt.NonModal)
+        self.dialog.show()
+        self._loop.create_task(self.fill_previews_atask(self.dialog, drive))
+
+    async def fill_previews_atask(self, dialog, drive):
+        # Thumbnails appear one by one as the worker pool extracts and decodes them
+        with profiler.span("previews"):
+            l_files = await asyncio.to_thread(self.latest_files, drive['device'], SDCardDialog.MAX_PREVIEWS)
+            d_positions = {file_path: position for position, file_path in enumerate(l_files)}
+            async for file_path, image in self.previews.aload_many(drive['id'], l_files, decode_thumbnail):
+                if not dialog.isVisible():
+                    break
+                dialog.add_preview(d_positions[file_path], image)
+
+    def latest_files(self, device, n):
+        # The monitor keeps a snapshot of the card (with mtimes) up to date: no walk, no stat
+        scanner = self.monitor.d_scanners.get(device)
+        if scanner is None:
+            return latest_shots(collect_card_files(device), n)
+        if not scanner.d_dirs:
+            scanner.scan()
+        return scanner.latest(n)
 
     def exit(self):
+        self.previews.shutdown()
+        self.orchestrator.close()
+        # Per-stage timings of the session (if profiling is enabled)
+        if profiler.is_enabled():
+            profiler.report()
         # Hide the tray icon and quit the application
         self.tray_icon.hide()
         self.parent_app_.quit()
@@ -121,13 +155,34 @@ class TrayApp:
 
     ### ----------------------------------------------------------------------
 
+    def on_offload_all(self):
+        # One job per attached card, already running jobs are kept as is
+        for drive in deque_removables:
+            self.orchestrator.add_job(drive['device'], drive['id'], drive['camera'])
+        self._loop.create_task(self.orchestrator.run())
+
+    def on_progress_event(self, event):
+        # Tooltip refresh on every file boundary, chunk events are already rate-limited
+        self.tray_icon.setToolTip(self.telemetry.summary_text())
+
     def on_tray_icon_activated(self, reason):
         # Left click handling
         if reason == QSystemTrayIcon.Trigger:
             self.menu.popup(QCursor.pos())
 
 
+def decode_thumbnail(data: bytes) -> QImage:
+    # Runs in a preview worker: QImage (unlike QPixmap) may be used outside the GUI thread
+    image = QImage.fromData(data)
+    return image.scaled(SDCardDialog.THUMBNAIL_SIZE, SDCardDialog.THUMBNAIL_SIZE,
+                        Qt.KeepAspectRatio, Qt.FastTransformation)
+
+
 class SDCardDialog(QDialog):
+    MAX_PREVIEWS = 100
+    COLUMNS = 10
+    THUMBNAIL_SIZE = 96
+
     def __init__(self, drive, parent=None):
         super().__init__(parent)
         self.setWindowTitle("SD Card Inserted")
@@ -139,12 +194,23 @@ class SDCardDialog(QDialog):
         message = QLabel(f"SD card inserted: {self.drive}")
         layout.addWidget(message)
 
+        # Latest shots, newest first
+        self.grid = QGridLayout()
+        layout.addLayout(self.grid)
+
         button_ok = QPushButton("OK")
         button_ok.clicked.connect(self.accept)
         layout.addWidget(button_ok)
 
         self.setLayout(layout)
 
+    def add_preview(self, position, image):
+        thumbnail = QLabel()
+        thumbnail.setFixedSize(self.THUMBNAIL_SIZE, self.THUMBNAIL_SIZE)
+        thumbnail.setAlignment(Qt.AlignCenter)
+        thumbnail.setPixmap(QPixmap.fromImage(image))
+        self.grid.addWidget(thumbnail, *divmod(position, self.COLUMNS))
+
 
 if __name__ == "__main__":
     tray_app = TrayApp()
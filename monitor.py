@@ -0,0 +1,147 @@
+"""
+Module provides the detection loop of attached cards shared by the tray app and the daemon.
+
+includes the monitor polling a drives provider (removable partitions by default, or the
+directory-backed provider where folders stand in for mounted cards), identifying and matching
+newly attached cards, and notifying subscribers of attached and detached cards.
+"""
+import asyncio
+import inspect
+import os
+from collections import deque
+
+from detectors import generate_id, get_identity_registry, get_removable_drives, match_camera_model
+from initialization import get_cameras
+from logger import error, success, trace
+from scanner import MEDIA_EXTENSIONS, IncrementalScanner
+import profiler
+
+
+class DirectoryDrivesProvider:
+    """Drives provider listing the subdirectories of  root  as mounted cards
+    (e.g. for headless tests: creating a folder inserts a card, removing it ejects the card)
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    async def __call__(self) -> list:
+        try:
+            return [entry.path for entry in os.scandir(self.root) if entry.is_dir()]
+        except FileNotFoundError:
+            return []
+
+
+def default_match(drive, scanner: IncrementalScanner = None):
+    return match_camera_model(drive, get_cameras(), scanner)
+
+
+async def _notify(callbacks, drive) -> None:
+    for callback in callbacks:
+        result = callback(drive)
+        if inspect.isawaitable(result):
+            await result
+
+
+class RemovablesMonitor:
+    """Polls the drives provider and keeps the  deque  of attached cards up to date
+
+    Every attached card gets an  IncrementalScanner  ( d_scanners ), shared by its camera matches
+    ( match(device, scanner) ) and its incremental offload jobs, so re-analyses of a card
+    re-list only its changed directories.
+
+    deque format --v
+    deque([{'device': str(drive), 'id': str(drive_id), 'camera': Optional[str]}, ... ])
+    """
+
+    def __init__(self, drives_provider=get_removable_drives, identify=generate_id, match=default_match,
+                 interval: float = 1.0, removables: deque = None):
+        self.drives_provider = drives_provider
+        self.identify = identify
+        self.match = match
+        self.interval = interval
+        self.removables = removables if removables is not None else deque()
+        self.d_scanners = {}            # device -> IncrementalScanner of the attached card
+        self.s_failed = set()           # devices whose identification failed, retried once re-attached
+        self.l_attached_callbacks = []  # callback(drive: dict), sync or async
+        self.l_detached_callbacks = []
+        self.l_updated_callbacks = []   # callback(removables: deque) once per changed poll
+
+    def on_attached(self, callback) -> None:
+        self.l_attached_callbacks.append(callback)
+
+    def on_detached(self, callback) -> None:
+        self.l_detached_callbacks.append(callback)
+
+    def on_updated(self, callback) -> None:
+        self.l_updated_callbacks.append(callback)
+
+    def find(self, device):
+        return next((drive for drive in self.removables if drive['device'] == device), None)
+
+    async def poll(self) -> bool:
+        """Single detection pass, True if the set of attached cards changed"""
+        # detect current
+        set_current_removables = set(await self.drives_provider())
+        # retrieve last
+        set_last_removables = {drive['device'] for drive in self.removables}
+        # suppose no changes
+        is_updated = False
+
+        # Forget failures of drives gone meanwhile
+        self.s_failed &= set_current_removables
+
+        # Check for new connected removables
+        for device in set_current_removables - set_last_removables - self.s_failed:
+            try:
+                with profiler.span("generate_id"):
+                    drive_id = self.identify(device)
+                scanner = IncrementalScanner(device, MEDIA_EXTENSIONS)
+                with profiler.span("match_camera_model"):
+                    camera_model = self.match(device, scanner)
+            except Exception as e:
+                # One unreadable card must not stop the detection of the others
+                error(f"Unable to identify the removable {device}: {e}")
+                self.s_failed.add(device)
+                continue
+            self.d_scanners[device] = scanner
+            drive = {'device': device, 'id': drive_id, 'camera': camera_model}
+            self.removables.append(drive)
+            success(f"The removable is matched with: {camera_model}")
+            await _notify(self.l_attached_callbacks, drive)
+            is_updated = True
+
+        # Check for disconnected drives
+        for drive in list(self.removables):
+            if drive['device'] not in set_current_removables:
+                self.removables.remove(drive)
+                self.d_scanners.pop(drive['device'], None)
+                get_identity_registry().forget(drive['device'])
+                success(f"The removable [{drive['id']}] was disconnected")
+                await _notify(self.l_detached_callbacks, drive)
+                is_updated = True
+
+        # Handle changes in  removables
+        if is_updated:
+            trace("removables = {}", self.removables)
+            await _notify(self.l_updated_callbacks, self.removables)
+        return is_updated
+
+    def reanalyze(self, device):
+        """Match the attached card again (e.g. after the camera wrote to it), return its camera"""
+        drive = self.find(device)
+        if drive is None:
+            return None
+        with profiler.span("match_camera_model"):
+            drive['camera'] = self.match(device, self.d_scanners.get(device))
+        return drive['camera']
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error(f"Removables detection failed, retrying: {e}")
+            await asyncio.sleep(self.interval)
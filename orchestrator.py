@@ -0,0 +1,209 @@
+"""
+Module provides concurrent offload of several cards at once.
+
+includes the card scan for media files, the per-card offload job with its camera-specific
+destination layout, and the orchestrator running all jobs in parallel under one shared
+bandwidth/memory budget.
+"""
+import asyncio
+import os
+
+from condocopy import TransferBudget, copy_files, move_files, plan_files
+from planner import HISTORY_FILENAME, ThroughputHistory
+from dedup import DEDUP_SKIP, ContentIndex
+from layout import DateLayout
+from logger import error, info, success, warning
+from scanner import MEDIA_EXTENSIONS, SKIPPED_DIRS, SKIPPED_PREFIXES, IncrementalScanner
+from telemetry import Telemetry
+from workers import media_executor
+
+# Job states --v
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+
+def collect_card_files(card_root, extensions=MEDIA_EXTENSIONS) -> list:
+    """List media files of the card (hidden and system directories are skipped)"""
+    l_files = []
+    for root, dirs, files in os.walk(card_root):
+        dirs[:] = [d for d in dirs if not d.startswith(SKIPPED_PREFIXES) and d not in SKIPPED_DIRS]
+        for filename in files:
+            if os.path.splitext(filename)[1].lower() in extensions:
+                l_files.append(os.path.join(root, filename))
+    return l_files
+
+
+def camera_destination(dst_root, camera_model, card_id) -> str:
+    """Camera-specific layout:  <dst_root>/<camera model>/<card ID>"""
+    return os.path.join(dst_root, camera_model or "Unknown_camera", card_id)
+
+
+class OffloadJob:
+    """Offload of a single card"""
+
+    def __init__(self, device, card_id, camera_model, dst_dir, move: bool = False,
+                 date_layout: bool = True, scanner: IncrementalScanner = None, targets: dict = None,
+                 executor=None):
+        self.device = device
+        self.card_id = card_id
+        self.camera_model = camera_model
+        self.dst_dir = dst_dir
+        self.move = move
+        # YYYY/YYYY-MM-DD/ folders inside the card's destination (flat if disabled),
+        # dates are resolved in the orchestrator's process pool
+        self.layout = DateLayout(dst_dir, executor=executor) if date_layout else None
+        # With a scanner only settled files added or changed since its previous scan are offloaded,
+        # a changed file replaces its earlier target in  targets  {source: target}
+        self.scanner = scanner
+        self.targets = targets
+        self.state = PENDING
+        self.files = []
+        self.failures = []  # [(PlanEntry, exception), ...] of files that could not be offloaded
+        self.error = None
+
+    async def dry_run(self, dedup: ContentIndex = None, dedup_mode: str = DEDUP_SKIP,
+                      history: ThroughputHistory = None):
+        """Scan the card and return its offload plan without writing anything
+        (raises  planner.InsufficientSpaceError  if the destination lacks space)
+        """
+        self.files = await asyncio.to_thread(self.collect_files)
+        return await plan_files(self.files, self.dst_dir, history=history, layout=self.layout,
+                                dedup=dedup, dedup_mode=dedup_mode, previous_targets=self.targets)
+
+    async def run(self, telemetry: Telemetry, budget: TransferBudget,
+                  dedup: ContentIndex = None, dedup_mode: str = DEDUP_SKIP,
+                  history: ThroughputHistory = None) -> None:
+        self.state = RUNNING
+        try:
+            # Card scan is blocking I/O, kept off the loop thread
+            # (files of an incremental dry run are kept: its scanner already reported them)
+            if self.scanner is None or not self.files:
+                self.files = await asyncio.to_thread(self.collect_files)
+            info(f"[{self.card_id}] {len(self.files)} files to offload into {self.dst_dir}")
+            offload = move_files if self.move else copy_files
+            self.failures = await offload(self.files, self.dst_dir, telemetry, budget=budget,
+                                          history=history, layout=self.layout, dedup=dedup, dedup_mode=dedup_mode,
+                                          previous_targets=self.targets) or []
+        except asyncio.CancelledError:
+            self.state = FAILED
+            self.error = "cancelled"
+            self.rescan_later(self.files)
+            raise
+        except Exception as e:
+            self.state = FAILED
+            self.error = e
+            self.rescan_later(self.files)
+            error(f"[{self.card_id}] offload failed: {e}")
+        else:
+            self.state = DONE
+            self.rescan_later(entry.source for entry, _ in self.failures)
+            if self.failures:
+                warning(f"[{self.card_id}] offload finished, {len(self.failures)} files failed")
+            else:
+                success(f"[{self.card_id}] offload finished")
+
+    def rescan_later(self, file_list) -> None:
+        """Files not offloaded are reported again by the next incremental job"""
+        if self.scanner is not None:
+            for file_path in file_list:
+                self.scanner.forget(file_path)
+
+    def collect_files(self) -> list:
+        if self.scanner is None:
+            return collect_card_files(self.device)
+        self.scanner.scan()
+        return self.scanner.take_settled()
+
+    def as_dict(self) -> dict:
+        return {'device': self.device,
+                'id': self.card_id,
+                'camera': self.camera_model,
+                'dst_dir': self.dst_dir,
+                'state': self.state,
+                'files': len(self.files),
+                'failed': len(self.failures),
+                'error': str(self.error) if self.error else None}
+
+
+class OffloadOrchestrator:
+    """Runs independent offload jobs of all attached cards in parallel.
+
+    All jobs share one  TransferBudget, so the overall read rate and copy buffer memory
+    stay within the limits no matter how many cards are being drained, and one content index,
+    so a card offloaded before (here or into the same archive elsewhere) is not copied again.
+    Planning stages of all jobs run in one process pool of at most  workers.MAX_MEDIA_WORKERS
+    processes, shut down by  close() .
+    """
+
+    def __init__(self, dst_root, telemetry: Telemetry = None,
+                 max_bytes_per_sec=None, max_buffer_bytes=256 * 1024 * 1024,
+                 dedup_mode: str = DEDUP_SKIP, workers: int = None):
+        self.dst_root = dst_root
+        # Processes of the planning stages (they read the cards), started on first use
+        self.executor = media_executor(workers)
+        self.telemetry = telemetry or Telemetry()
+        self.budget = TransferBudget(max_bytes_per_sec, max_buffer_bytes)
+        self.dedup = ContentIndex(os.path.join(dst_root, "content_index.json"), self.executor)
+        self.dedup_mode = dedup_mode
+        # One history for all jobs, so parallel jobs don't overwrite each other's rates
+        self.history = ThroughputHistory(os.path.join(dst_root, HISTORY_FILENAME))
+        self.jobs = {}      # device -> OffloadJob
+        self.scanners = {}  # card ID -> IncrementalScanner of incremental jobs
+        self.d_targets = {}  # card ID -> {source: target} written by its incremental jobs
+        self._tasks = {}    # device -> asyncio.Task
+
+    def add_job(self, device, card_id, camera_model=None, move: bool = False,
+                incremental: bool = False, scanner: IncrementalScanner = None) -> OffloadJob:
+        """New job of the card (the running one if any); an  incremental  job offloads only
+        the files the card got since the previous incremental job of the same card
+        (its  scanner  may be given, e.g. the one already kept by  monitor.RemovablesMonitor )
+        """
+        job = self.jobs.get(device)
+        if job is not None and job.state in (PENDING, RUNNING):
+            return job
+        targets = None
+        if incremental:
+            if scanner is None:
+                scanner = self.scanners.get(card_id)
+            if scanner is None or scanner.root != os.path.abspath(device):
+                scanner = IncrementalScanner(device, MEDIA_EXTENSIONS)
+            if self.scanners.get(card_id) is not scanner:
+                self.scanners[card_id] = scanner
+                self.d_targets[card_id] = {}
+            targets = self.d_targets[card_id]
+        else:
+            scanner = None
+        job = OffloadJob(device, card_id, camera_model,
+                         camera_destination(self.dst_root, camera_model, card_id), move,
+                         scanner=scanner, targets=targets, executor=self.executor)
+        self.jobs[device] = job
+        return job
+
+    def start(self) -> list:
+        """Schedule all pending jobs in the running loop, return their tasks"""
+        for device, job in self.jobs.items():
+            if job.state == PENDING and device not in self._tasks:
+                task = asyncio.create_task(job.run(self.telemetry, self.budget,
+                                                   self.dedup, self.dedup_mode, self.history))
+                task.add_done_callback(lambda _, device=device: self._tasks.pop(device, None))
+                self._tasks[device] = task
+        return list(self._tasks.values())
+
+    async def run(self) -> dict:
+        """Run all pending jobs to completion"""
+        # Cancelled jobs must not abort the others
+        await asyncio.gather(*self.start(), return_exceptions=True)
+        return self.status()
+
+    def cancel(self, device) -> bool:
+        task = self._tasks.get(device)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    def status(self) -> dict:
+        return {device: job.as_dict() for device, job in self.jobs.items()}
+
+    def close(self) -> None:
+        """Stop the worker processes of the planning stages"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
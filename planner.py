@@ -0,0 +1,313 @@
+"""
+Module provides the dry-run planning stage of an offload.
+
+includes the immutable offload plan (source, target, size and action of every file) with its
+JSON serialization, the destination free space check, and the per-device throughput history
+used to estimate how long the plan takes.
+"""
+import json
+import os
+import shutil
+import time
+from collections import namedtuple
+
+import psutil
+
+from logger import debug, is_enabled, warning
+
+# Plan actions --v
+COPY = "copy"       # target does not exist
+SKIP = "skip"       # identical target (or, with dedup, the same content elsewhere) already exists
+RENAME = "rename"   # target name is taken by a different file, the copy gets a "(n)" suffix
+LINK = "link"       # same content is archived elsewhere, the target is hard-linked to it
+
+# PlanEntry format --v
+# PlanEntry(source: str, target: str, size: int, action: str, origin: Optional[str])
+# origin  - archived file with the same content (dedup SKIP and LINK entries only)
+PlanEntry = namedtuple("PlanEntry", "source target size action origin", defaults=(None,))
+
+# Free space left untouched on the destination (bytes)
+DEFAULT_RESERVE_BYTES = 256 * 1024 * 1024
+# Throughput assumed for a device never seen before (bytes/sec)
+DEFAULT_THROUGHPUT = 20 * 1024 * 1024
+# Throughput history file, kept in the archive root (next to the content index)
+HISTORY_FILENAME = "throughput_history.json"
+
+
+class InsufficientSpaceError(OSError):
+    pass
+
+
+def check_free_space(dst_dir, needed_bytes: int, reserve_bytes: int = DEFAULT_RESERVE_BYTES) -> int:
+    """Raise  InsufficientSpaceError  if  dst_dir  can't take  needed_bytes , return free bytes"""
+    existing = os.path.abspath(dst_dir)
+    while not os.path.exists(existing):
+        existing = os.path.dirname(existing)
+    free = shutil.disk_usage(existing).free
+    needed = needed_bytes + reserve_bytes
+    if needed > free:
+        raise InsufficientSpaceError(
+            f"Not enough space in {dst_dir}: {needed / 1024 ** 3:.2f} GB needed "
+            f"(incl. reserve), {free / 1024 ** 3:.2f} GB free")
+    return free
+
+
+def upper_bound_bytes(file_list) -> int:
+    """Bytes to write if every file is copied (one stat per file, no metadata read)"""
+    total = 0
+    for file_path in file_list:
+        try:
+            total += os.path.getsize(file_path)
+        except OSError:
+            pass    # vanished since the scan
+    return total
+
+
+def get_source_device(path, partitions=None) -> str:
+    """Device of the partition holding the path (the longest matching mountpoint wins)"""
+    if partitions is None:
+        partitions = psutil.disk_partitions(all=True)
+    apath = os.path.abspath(path)
+    best = None
+    for partition in partitions:
+        if apath.startswith(partition.mountpoint) and \
+                (best is None or len(partition.mountpoint) > len(best.mountpoint)):
+            best = partition
+    return best.device if best else os.path.splitdrive(apath)[0] or 'unknown'
+
+
+class ThroughputHistory:
+    """Persisted per-device copy throughput (exponential moving average, bytes/sec)"""
+
+    def __init__(self, filename=HISTORY_FILENAME, smoothing: float = 0.3):
+        self.filename = filename
+        self.smoothing = smoothing
+        self.d_rates = {}
+        if filename and os.path.exists(filename):
+            try:
+                with open(filename, 'r', encoding='utf8') as file:
+                    self.d_rates = json.load(file)
+            except (OSError, ValueError) as e:
+                warning(f"Throughput history {filename} is unreadable: {e}")
+
+    def rate(self, device) -> float:
+        return self.d_rates.get(device, DEFAULT_THROUGHPUT)
+
+    def estimate(self, device, n_bytes: int) -> float:
+        """Estimated seconds to copy  n_bytes  from the device"""
+        return n_bytes / self.rate(device)
+
+    def record(self, device, bytes_per_sec: float) -> None:
+        if bytes_per_sec <= 0:
+            return
+        previous = self.d_rates.get(device)
+        self.d_rates[device] = bytes_per_sec if previous is None else \
+            previous + self.smoothing * (bytes_per_sec - previous)
+
+    def record_run(self, device, n_bytes: int, seconds: float) -> None:
+        """Take the rate measured by one plan run (its bytes over its own duration) and save"""
+        if n_bytes and seconds > 0:
+            self.record(device, n_bytes / seconds)
+            self.save()
+
+    def save(self) -> None:
+        if not self.filename:
+            return
+        tmp_filename = self.filename + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.filename)), exist_ok=True)
+            with open(tmp_filename, 'w', encoding='utf8') as file:
+                json.dump(self.d_rates, file, indent=1)
+            os.replace(tmp_filename, self.filename)
+        except OSError as e:
+            warning(f"Unable to save throughput history to {self.filename}: {e}")
+
+
+class OffloadPlan:
+    """Immutable plan of an offload: what happens to every file, and what it costs"""
+
+    def __init__(self, entries, dst_dir, device, estimated_sec: float, created=None):
+        self.entries = tuple(entries)
+        self.dst_dir = dst_dir
+        self.device = device
+        self.estimated_sec = estimated_sec
+        self.created = created or time.time()
+
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            raise AttributeError(f"OffloadPlan is immutable, '{name}' cannot be changed")
+        super().__setattr__(name, value)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(entry.size for entry in self.entries)
+
+    @property
+    def copy_bytes(self) -> int:
+        """Bytes actually to be written (skipped and linked files excluded)"""
+        return sum(entry.size for entry in self.entries if entry.action in (COPY, RENAME))
+
+    def count(self, action) -> int:
+        return sum(1 for entry in self.entries if entry.action == action)
+
+    def check_space(self, reserve_bytes: int = DEFAULT_RESERVE_BYTES) -> int:
+        """Raise  InsufficientSpaceError  if the destination can't take the plan, return free bytes"""
+        return check_free_space(self.dst_dir, self.copy_bytes, reserve_bytes)
+
+    def summary(self) -> str:
+        return (f"{len(self)} files, {self.copy_bytes / 1024 ** 2:.1f} MB to write "
+                f"({self.count(COPY)} copy, {self.count(RENAME)} rename, {self.count(LINK)} link, "
+                f"{self.count(SKIP)} skip), ~{self.estimated_sec:.0f}s")
+
+    def to_dict(self) -> dict:
+        return {'dst_dir': self.dst_dir,
+                'device': self.device,
+                'estimated_sec': self.estimated_sec,
+                'created': self.created,
+                'entries': [list(entry) for entry in self.entries]}
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+    @classmethod
+    def from_dict(cls, d_plan: dict) -> "OffloadPlan":
+        return cls([PlanEntry(*entry) for entry in d_plan['entries']], d_plan['dst_dir'],
+                   d_plan['device'], d_plan['estimated_sec'], d_plan['created'])
+
+    @classmethod
+    def from_json(cls, text: str) -> "OffloadPlan":
+        return cls.from_dict(json.loads(text))
+
+
+def free_target_name(filename, taken: set) -> str:
+    """First free name in the "name(1).ext", "name(2).ext", ... sequence"""
+    stem, ext = os.path.splitext(filename)
+    n = 1
+    while f"{stem}({n}){ext}" in taken:
+        n += 1
+    return f"{stem}({n}){ext}"
+
+
+def find_identical_target(target_dir, filename, src_stat, taken: set, claimed=()):
+    """Target of the "name.ext", "name(1).ext", ... sequence in  target_dir  with the size and
+    modification time of the source (e.g. same-named files of two card folders offloaded before),
+    None if there is none; only taken names are stat-ed, targets in  claimed  are passed over
+    """
+    stem, ext = os.path.splitext(filename)
+    candidate, n = filename, 0
+    while candidate in taken:
+        target = os.path.join(target_dir, candidate)
+        if target not in claimed and _is_same_file(target, src_stat):
+            return target
+        n += 1
+        candidate = f"{stem}({n}){ext}"
+    return None
+
+
+def _is_same_file(target, src_stat) -> bool:
+    """Target has the size and modification time of the source (already offloaded)"""
+    try:
+        dst_stat = os.stat(target)
+    except OSError:
+        return False
+    return (dst_stat.st_size, dst_stat.st_mtime) == (src_stat.st_size, src_stat.st_mtime)
+
+
+def build_plan(file_list, dst_dir, device=None, history: ThroughputHistory = None,
+               layout=None, dedup=None, dedup_mode: str = "skip",
+               previous_targets: dict = None) -> OffloadPlan:
+    """Turn the list of source files into an offload plan.
+
+    With a  layout  (e.g.  layout.DateLayout ) targets are spread over its directories,
+    otherwise all of them go flat into  dst_dir . Every target directory is listed once,
+    each source is stat-ed once and a target only when its name is already taken.
+    With a  dedup  index ( dedup.ContentIndex ) content already archived elsewhere is
+    skipped or, in "link" mode, hard-linked instead of copied.
+    With  previous_targets  {source: target}  of earlier offloads (e.g. a file that grew while
+    it was written), a source whose earlier target still exists replaces it instead of getting
+    a "(n)" copy; the dict is updated with the targets of this plan.
+    Sources skipped by name are settled first, only the rest is looked up in the dedup index.
+    """
+    d_taken = {}    # target directory -> names taken in it
+    if layout is not None:
+        layout.resolve(file_list)
+
+    # Cheap pass (stat and directory listings only): files already offloaded under their name
+    # are skipped here, so only the others are hashed for the dedup lookup
+    l_items = []
+    s_claimed = set()   # existing targets already matched by a source of this plan
+    for file_path in file_list:
+        try:
+            src_stat = os.stat(file_path)
+        except OSError:
+            continue    # vanished since the scan
+        previous = previous_targets.get(file_path) if previous_targets is not None else None
+        if previous is not None and os.path.exists(previous):
+            target_dir = os.path.dirname(previous)  # even if its date moved meanwhile
+        else:
+            previous = None
+            target_dir = layout.target_dir_of(file_path) if layout is not None else dst_dir
+        taken = d_taken.get(target_dir)
+        if taken is None:
+            try:
+                taken = d_taken[target_dir] = set(os.listdir(target_dir))
+            except FileNotFoundError:
+                taken = d_taken[target_dir] = set()
+        if previous is not None:
+            existing = previous if _is_same_file(previous, src_stat) else None
+        else:
+            existing = find_identical_target(target_dir, os.path.basename(file_path), src_stat, taken,
+                                             s_claimed)
+        if existing is not None:
+            s_claimed.add(existing)
+        l_items.append((file_path, src_stat, target_dir, previous, existing))
+
+    l_lookups = [item[0] for item in l_items if item[4] is None] if dedup is not None else []
+    if l_lookups:
+        dedup.prefetch(l_lookups)
+    entries = []
+    try:
+        for file_path, src_stat, target_dir, previous, existing in l_items:
+            if existing is not None:
+                entries.append(PlanEntry(file_path, existing, src_stat.st_size, SKIP))
+                continue
+            taken = d_taken[target_dir]
+            action = COPY
+            if previous is not None:
+                filename = os.path.basename(previous)   # the earlier target is overwritten
+            else:
+                filename = os.path.basename(file_path)
+                if filename in taken:   # by a different file, on disk or earlier in this plan
+                    action = RENAME
+                    filename = free_target_name(filename, taken)
+            origin = None
+            if dedup is not None:
+                origin = dedup.find_duplicate(file_path, src_stat.st_size)
+                if origin is not None and dedup_mode != LINK:
+                    entries.append(PlanEntry(file_path, origin, src_stat.st_size, SKIP, origin))
+                    continue
+                if origin is not None:
+                    action = LINK
+            taken.add(filename)
+            entries.append(PlanEntry(file_path, os.path.join(target_dir, filename), src_stat.st_size,
+                                     action, origin))
+            if previous_targets is not None:
+                previous_targets[file_path] = entries[-1].target
+    finally:
+        if l_lookups:
+            dedup.forget_prefetched(l_lookups)
+
+    if device is None:
+        device = get_source_device(entries[0].source) if entries else 'unknown'
+    history = history or ThroughputHistory(filename=None)
+    plan = OffloadPlan(entries, dst_dir, device,
+                       history.estimate(device, sum(e.size for e in entries if e.action in (COPY, RENAME))))
+    if is_enabled("DEBUG", __name__):
+        debug("Offload plan for {}: {}", dst_dir, plan.summary())
+    return plan
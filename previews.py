@@ -0,0 +1,153 @@
+"""
+Module provides fast previews of the shots stored on a card.
+
+includes the extraction of embedded JPEG previews (the EXIF thumbnail of JPEG files, the preview
+stored in RAW headers) reading a bounded header only, the selection of the latest shots, and
+the size-bounded LRU cache keyed by card ID and path, filled lazily by a worker pool.
+"""
+import asyncio
+import heapq
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from logger import debug
+
+SOI = b'\xff\xd8\xff'   # JPEG start of image (+ first marker byte)
+EOI = b'\xff\xd9'       # JPEG end of image
+
+JPEG_EXTENSIONS = {'.jpg', '.jpeg'}
+RAW_EXTENSIONS = {'.arw', '.cr2', '.cr3', '.nef', '.nrw', '.raf', '.rw2', '.orf', '.dng', '.pef', '.srw'}
+
+# Bytes read from the file start: EXIF data of a JPEG is limited to a 64 KB APP1 segment,
+# RAW files keep a small preview in the first IFDs
+JPEG_HEADER_BYTES = 128 * 1024
+RAW_HEADER_BYTES = 2 * 1024 * 1024
+MIN_PREVIEW_BYTES = 1024
+
+
+def _jpeg_in(data: bytes, start: int = 0, end: int = None) -> Optional[bytes]:
+    """First complete embedded JPEG within  data[start:end]"""
+    end = len(data) if end is None else end
+    soi = data.find(SOI, start, end)
+    while soi != -1:
+        eoi = data.find(EOI, soi + MIN_PREVIEW_BYTES, end)
+        if eoi == -1:
+            return None
+        # The thumbnail must not contain another SOI before its end (nested/bogus match)
+        if data.find(SOI, soi + len(SOI), eoi) == -1:
+            return data[soi:eoi + len(EOI)]
+        soi = data.find(SOI, soi + len(SOI), end)
+    return None
+
+
+def _exif_thumbnail(data: bytes) -> Optional[bytes]:
+    """Thumbnail of the APP1 (EXIF) segment of a JPEG file"""
+    pos = 2     # after the main SOI
+    while pos + 4 <= len(data) and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        length = int.from_bytes(data[pos + 2:pos + 4], 'big')
+        if marker == 0xE1 and data[pos + 4:pos + 10] == b'Exif\x00\x00':
+            return _jpeg_in(data, pos + 10, min(pos + 2 + length, len(data)))
+        if marker == 0xDA:  # start of scan: no more metadata segments
+            break
+        pos += 2 + length
+    return None
+
+
+def extract_preview(file_path) -> Optional[bytes]:
+    """Embedded preview JPEG of the file (bounded header read), None if there is none"""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in JPEG_EXTENSIONS:
+        header_bytes = JPEG_HEADER_BYTES
+    elif ext in RAW_EXTENSIONS:
+        header_bytes = RAW_HEADER_BYTES
+    else:
+        return None
+    try:
+        with open(file_path, 'rb') as file:
+            data = file.read(header_bytes)
+    except OSError:
+        return None
+    if ext in JPEG_EXTENSIONS:
+        return _exif_thumbnail(data) if data.startswith(SOI) else None
+    return _jpeg_in(data)
+
+
+def latest_shots(file_list, n: int = 100) -> list:
+    """n  most recently modified files, newest first"""
+    def mtime(file_path):
+        try:
+            return os.stat(file_path).st_mtime
+        except OSError:
+            return 0.0
+    return heapq.nlargest(n, file_list, key=mtime)
+
+
+class PreviewCache:
+    """LRU cache of preview JPEGs  {(card_id, path): bytes}  bounded by total size"""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, workers: int = 4):
+        self.max_bytes = max_bytes
+        self._d_cache = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="preview")
+
+    def get(self, card_id, file_path) -> Optional[bytes]:
+        with self._lock:
+            data = self._d_cache.get((card_id, file_path))
+            if data is not None:
+                self._d_cache.move_to_end((card_id, file_path))
+            return data
+
+    def put(self, card_id, file_path, data: bytes) -> None:
+        with self._lock:
+            key = (card_id, file_path)
+            if key in self._d_cache:
+                self._cached_bytes -= len(self._d_cache.pop(key))
+            self._d_cache[key] = data
+            self._cached_bytes += len(data)
+            while self._cached_bytes > self.max_bytes and self._d_cache:
+                _, evicted = self._d_cache.popitem(last=False)
+                self._cached_bytes -= len(evicted)
+
+    def forget_card(self, card_id) -> None:
+        with self._lock:
+            for key in [key for key in self._d_cache if key[0] == card_id]:
+                self._cached_bytes -= len(self._d_cache.pop(key))
+
+    def load(self, card_id, file_path, decode=None):
+        """Preview of the file (cached or extracted), passed through  decode  if given"""
+        data = self.get(card_id, file_path)
+        if data is None:
+            data = extract_preview(file_path)
+            if data is None:
+                return None
+            self.put(card_id, file_path, data)
+        return decode(data) if decode is not None else data
+
+    async def aload_many(self, card_id, file_list, decode=None):
+        """Async generator of  (file_path, preview)  in order of completion, extraction and
+        decoding run in the worker pool; files without a preview are left out
+        """
+        loop = asyncio.get_running_loop()
+
+        def load_item(file_path):
+            return file_path, self.load(card_id, file_path, decode)
+
+        futures = [loop.run_in_executor(self._executor, load_item, file_path) for file_path in file_list]
+        try:
+            for future in asyncio.as_completed(futures):
+                file_path, preview = await future
+                if preview is not None:
+                    yield file_path, preview
+        finally:
+            for future in futures:
+                future.cancel()     # dialog closed before all previews were shown
+        debug("Previews of {} files of [{}] loaded", len(futures), card_id)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,166 @@
+"""
+Module provides lightweight timing spans and an optional cProfile capture for the pipeline stages.
+
+includes the span context manager and the timed decorator (both near-free while profiling is
+disabled), per-stage latency histograms, the report writer and a single-run cProfile capture.
+
+Profiling is enabled by  enable()  or by the  CONDOCOPY_PROFILE=1  environment variable,
+CONDOCOPY_PROFILE=cprofile  additionally asks the CLI entry points for a cProfile capture.
+"""
+import asyncio
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import time
+from bisect import bisect_left
+from functools import wraps
+
+from logger import profile
+
+_enabled = os.environ.get("CONDOCOPY_PROFILE", "") not in ("", "0")
+
+# Upper bounds of the histogram buckets, in milliseconds (the last bucket is open-ended)
+BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class Histogram:
+    """Latency histogram of a single stage"""
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS_MS, seconds * 1000)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.min = seconds if self.min is None else min(self.min, seconds)
+
+    def as_dict(self) -> dict:
+        labels = [f"<={ms}ms" for ms in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+        return {'count': self.count,
+                'total_sec': round(self.total, 6),
+                'mean_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+                'min_ms': round((self.min or 0.0) * 1000, 3),
+                'max_ms': round(self.max * 1000, 3),
+                'buckets': dict(zip(labels, self.counts))}
+
+
+# d_histograms format --v
+# {'stage_name': Histogram, ... }
+d_histograms = {}
+
+
+def enable(flag: bool = True) -> None:
+    global _enabled
+    _enabled = flag
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def is_cprofile_requested() -> bool:
+    return os.environ.get("CONDOCOPY_PROFILE", "") == "cprofile"
+
+
+def record(name: str, seconds: float) -> None:
+    """Add one measured duration to the stage histogram"""
+    histogram = d_histograms.get(name)
+    if histogram is None:
+        histogram = d_histograms[name] = Histogram()
+    histogram.add(seconds)
+
+
+class _Span:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record(self.name, time.perf_counter() - self.started)
+        return False
+
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def span(name: str):
+    """Context manager timing the enclosed block as the  name  stage
+
+    usage --v
+        with span("generate_id"):
+            drive_id = generate_id(drive)
+    """
+    return _Span(name) if _enabled else _NULL_SPAN
+
+
+def timed(name: str = None):
+    """Decorator timing every call of the function (sync or async) as the  name  stage"""
+
+    def decorator(func):
+        stage = name or func.__qualname__
+
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await func(*args, **kwargs)
+                with _Span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def reset() -> None:
+    d_histograms.clear()
+
+
+def report() -> dict:
+    """Log and return per-stage histograms sorted by the total time spent"""
+    d_report = {name: histogram.as_dict()
+                for name, histogram in sorted(d_histograms.items(),
+                                              key=lambda item: item[1].total, reverse=True)}
+    for name, d_stats in d_report.items():
+        profile(f"{name:<25} n={d_stats['count']:<6} total={d_stats['total_sec']:.3f}s "
+                f"mean={d_stats['mean_ms']:.3f}ms max={d_stats['max_ms']:.3f}ms")
+    return d_report
+
+
+@contextlib.contextmanager
+def profile_run(stats_filename=None, sort_by: str = "cumulative", limit: int = 30):
+    """Capture a cProfile of the enclosed block (a single run), log the top functions
+    and optionally save raw stats for  `python -m pstats <stats_filename>`
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if stats_filename:
+            profiler.dump_stats(stats_filename)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats(sort_by).print_stats(limit)
+        profile(f"cProfile capture:\n{stream.getvalue()}")
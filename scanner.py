@@ -0,0 +1,178 @@
+"""
+Module provides the incremental re-scan of an attached card.
+
+includes the per-directory snapshot (modification time, subdirectories and files with their
+size and modification time) and the scanner re-listing only the directories whose modification
+time changed since the previous scan, reporting added, removed and changed files.
+"""
+import heapq
+import os
+import time
+from collections import namedtuple
+
+from logger import debug
+
+# Extensions of files to offload (lowercase)
+MEDIA_EXTENSIONS = {
+    # images
+    '.jpg', '.jpeg', '.heic', '.heif', '.png', '.tif', '.tiff', '.bmp', '.gif', '.webp',
+    # raw images
+    '.arw', '.cr2', '.cr3', '.nef', '.nrw', '.raf', '.rw2', '.orf', '.dng', '.pef', '.srw',
+    # videos
+    '.mp4', '.mov', '.mts', '.m2ts', '.avi', '.mxf', '.3gp', '.mkv',
+    # audio
+    '.wav', '.mp3', '.m4a',
+}
+
+# Directories of the card never scanned (by  orchestrator.collect_card_files()  as well)
+SKIPPED_DIRS = {'System Volume Information'}
+SKIPPED_PREFIXES = ('.', '$')
+# FAT/exFAT keep modification times with a 2 s resolution: a directory changed within this time
+# of its listing may keep the same mtime, so it is listed again on the next scan
+MTIME_RESOLUTION = 2.0
+# Files modified less than this before their listing may still be written
+SETTLE_SECONDS = 10.0
+
+# DirSnapshot format --v
+# DirSnapshot(mtime_ns: int, listed_at: float, subdirs: tuple, d_files: {name: (size, mtime_ns)})
+DirSnapshot = namedtuple("DirSnapshot", "mtime_ns listed_at subdirs d_files")
+# ScanDiff format --v
+# ScanDiff(added: list, removed: list, changed: list)  of absolute file paths
+ScanDiff = namedtuple("ScanDiff", "added removed changed")
+
+
+class IncrementalScanner:
+    """Keeps the snapshot of a card's tree and re-lists only the directories that changed
+
+    Creating, deleting or renaming an entry updates its directory's mtime, rewriting a file
+    in place does not: files modified less than  SETTLE_SECONDS  ago (they may still be written,
+    e.g. by a tethered camera) are re-stat-ed by every scan until they settle, other files are not.
+    Added and changed files are also kept pending until they settle, see  take_settled() .
+    """
+
+    def __init__(self, root, extensions=None):
+        self.root = os.path.abspath(root)
+        self.extensions = extensions    # lowercase extensions of files to track, all if None
+        self.d_dirs = {}                # absolute directory path -> DirSnapshot
+        self._d_settling = {}           # directory -> names of files to re-stat on the next scan
+        self._s_pending = set()         # added/changed files not yet taken by  take_settled()
+        self.n_listed = 0               # directories listed by the last scan
+
+    def _is_tracked(self, filename) -> bool:
+        return self.extensions is None or os.path.splitext(filename)[1].lower() in self.extensions
+
+    def _list(self, directory, mtime_ns: int) -> DirSnapshot:
+        subdirs, d_files = [], {}
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in SKIPPED_DIRS and not entry.name.startswith(SKIPPED_PREFIXES):
+                            subdirs.append(entry.name)
+                    elif self._is_tracked(entry.name):
+                        stat = entry.stat(follow_symlinks=False)
+                        d_files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    continue    # vanished while listing
+        self.n_listed += 1
+        return DirSnapshot(mtime_ns, time.time(), tuple(subdirs), d_files)
+
+    def scan(self) -> ScanDiff:
+        """Update the snapshot, return the difference to the previous one (all files on the first scan)"""
+        self.n_listed = 0
+        added, removed, changed = [], [], []
+        d_old = self.d_dirs
+        d_new = {}
+        d_settling, self._d_settling = self._d_settling, {}
+        now = time.time()
+
+        l_stack = [self.root]
+        while l_stack:
+            directory = l_stack.pop()
+            old = d_old.get(directory)
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+                if old is not None and old.mtime_ns == mtime_ns and \
+                        old.listed_at - mtime_ns / 1e9 > MTIME_RESOLUTION:
+                    snapshot = old
+                else:
+                    snapshot = self._list(directory, mtime_ns)
+            except OSError:
+                continue    # removed meanwhile, its files are reported below
+            d_new[directory] = snapshot
+            l_stack.extend(os.path.join(directory, name) for name in snapshot.subdirs)
+
+            d_old_files = old.d_files if old is not None else {}
+            if snapshot is old:
+                # Unchanged listing: only the files still being written are checked
+                for name in d_settling.get(directory, ()):
+                    file_path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(file_path)
+                    except OSError:
+                        continue
+                    if (stat.st_size, stat.st_mtime_ns) != d_old_files.get(name):
+                        d_old_files[name] = (stat.st_size, stat.st_mtime_ns)
+                        changed.append(file_path)
+                    if now - stat.st_mtime_ns / 1e9 < SETTLE_SECONDS:
+                        self._d_settling.setdefault(directory, set()).add(name)
+                continue
+            for name, metadata in snapshot.d_files.items():
+                if now - metadata[1] / 1e9 < SETTLE_SECONDS:
+                    self._d_settling.setdefault(directory, set()).add(name)
+                previous = d_old_files.get(name)
+                if previous is None:
+                    added.append(os.path.join(directory, name))
+                elif previous != metadata:
+                    changed.append(os.path.join(directory, name))
+            removed.extend(os.path.join(directory, name) for name in d_old_files
+                           if name not in snapshot.d_files)
+
+        # Directories gone since the previous scan (with their whole subtrees)
+        for directory in d_old.keys() - d_new.keys():
+            removed.extend(os.path.join(directory, name) for name in d_old[directory].d_files)
+
+        self.d_dirs = d_new
+        self._s_pending.update(added, changed)
+        self._s_pending.difference_update(removed)
+        debug("Scan of {}: {}/{} directories listed, +{} -{} ~{} files",
+              self.root, self.n_listed, len(d_new), len(added), len(removed), len(changed))
+        return ScanDiff(added, removed, changed)
+
+    def take_settled(self) -> list:
+        """Added or changed files of the scans so far that were not modified for  SETTLE_SECONDS ,
+        each file is returned once (again if it changes later); files still written stay pending
+        """
+        now = time.time()
+        l_settled = []
+        for file_path in self._s_pending:
+            snapshot = self.d_dirs.get(os.path.dirname(file_path))
+            metadata = snapshot.d_files.get(os.path.basename(file_path)) if snapshot else None
+            if metadata is not None and now - metadata[1] / 1e9 >= SETTLE_SECONDS:
+                l_settled.append(file_path)
+        self._s_pending.difference_update(l_settled)
+        return l_settled
+
+    def forget(self, file_path) -> None:
+        """Drop the file from the snapshot, so the next scan reports it as added again"""
+        snapshot = self.d_dirs.get(os.path.dirname(os.path.abspath(file_path)))
+        if snapshot is not None:
+            snapshot.d_files.pop(os.path.basename(file_path), None)
+            # force the re-listing of the directory
+            self.d_dirs[os.path.dirname(os.path.abspath(file_path))] = snapshot._replace(mtime_ns=-1)
+
+    def files(self) -> list:
+        """All tracked files of the last snapshot"""
+        return [os.path.join(directory, name)
+                for directory, snapshot in self.d_dirs.items() for name in snapshot.d_files]
+
+    def latest(self, n: int) -> list:
+        """n  most recently modified files of the last snapshot, newest first (nothing is stat-ed)"""
+        newest = heapq.nlargest(n, ((metadata[1], directory, name)
+                                    for directory, snapshot in self.d_dirs.items()
+                                    for name, metadata in snapshot.d_files.items()))
+        return [os.path.join(directory, name) for _, directory, name in newest]
+
+    def directories(self) -> list:
+        """Directories of the last snapshot relative to the root (as  detectors.get_directories() )"""
+        return [os.path.relpath(directory, self.root) for directory in self.d_dirs if directory != self.root]
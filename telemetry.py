@@ -0,0 +1,213 @@
+"""
+Module provides lightweight progress telemetry for the copy engine.
+
+includes the progress event type, the rate-limited event hub used inside the copy loop,
+per-device throughput and in-flight accounting, and ready-made subscribers
+for the loguru logger and for a JSON metrics dump.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import namedtuple
+
+from logger import debug, info, trace, warning
+
+# Event kinds --v
+FILE_START = "file_start"
+FILE_CHUNK = "file_chunk"
+FILE_FINISH = "file_finish"
+FILE_ERROR = "file_error"
+
+# Progress event format --v
+# ProgressEvent(kind, device, path, done_bytes, total_bytes, bytes_per_sec, in_flight, timestamp)
+ProgressEvent = namedtuple("ProgressEvent",
+                           "kind device path done_bytes total_bytes bytes_per_sec in_flight timestamp")
+
+
+class DeviceStats:
+    """Accumulated transfer counters of a single source device"""
+    __slots__ = ("bytes_done", "bytes_total", "files_done", "files_total", "in_flight",
+                 "started", "last_activity")
+
+    def __init__(self):
+        self.bytes_done = 0
+        self.bytes_total = 0
+        self.files_done = 0
+        self.files_total = 0
+        self.in_flight = 0
+        self.started = None
+        self.last_activity = None
+
+    def throughput(self, now=None) -> float:
+        """Average bytes/sec since the first file of the device started"""
+        if self.started is None:
+            return 0.0
+        elapsed = (now or time.monotonic()) - self.started
+        return self.bytes_done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self, now=None):
+        """Seconds left for the known amount of bytes, None if unknown"""
+        rate = self.throughput(now)
+        if not rate:
+            return None
+        return max(self.bytes_total - self.bytes_done, 0) / rate
+
+    def as_dict(self, now=None) -> dict:
+        return {'bytes_done': self.bytes_done,
+                'bytes_total': self.bytes_total,
+                'files_done': self.files_done,
+                'files_total': self.files_total,
+                'in_flight': self.in_flight,
+                'bytes_per_sec': round(self.throughput(now), 1),
+                'eta_sec': self.eta(now)}
+
+
+class Telemetry:
+    """Collects copy progress and fans structured events out to subscribers.
+
+    Start/finish/error events are always delivered, chunk events are rate-limited to one per
+    `chunk_interval` seconds per file so the hot copy loop only pays for a counter update.
+    Subscribers are plain callables taking a single `ProgressEvent`.
+    """
+
+    def __init__(self, chunk_interval: float = 0.5):
+        self.chunk_interval = chunk_interval
+        self.devices = {}           # device -> DeviceStats
+        self.subscribers = []
+        self._last_chunk_emit = {}  # path -> monotonic time of the last chunk event
+
+    # --- subscribers -----------------------------------------------------
+
+    def subscribe(self, callback) -> None:
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback) -> None:
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def _emit(self, kind, device, path, done_bytes, total_bytes, now) -> None:
+        if not self.subscribers:
+            return
+        stats = self.devices[device]
+        event = ProgressEvent(kind, device, path, done_bytes, total_bytes,
+                              stats.throughput(now), self.in_flight, now)
+        for callback in self.subscribers:
+            callback(event)
+
+    def _stats(self, device) -> DeviceStats:
+        stats = self.devices.get(device)
+        if stats is None:
+            stats = self.devices[device] = DeviceStats()
+        return stats
+
+    # --- copy engine hooks -----------------------------------------------
+
+    def plan(self, device, n_files: int, n_bytes: int) -> None:
+        """Register the amount of work queued for the device (used for ETA)"""
+        stats = self._stats(device)
+        stats.files_total += n_files
+        stats.bytes_total += n_bytes
+
+    def file_started(self, device, path, total_bytes: int) -> None:
+        now = time.monotonic()
+        stats = self._stats(device)
+        if stats.started is None:
+            stats.started = now
+        stats.in_flight += 1
+        stats.last_activity = now
+        self._last_chunk_emit[path] = now
+        self._emit(FILE_START, device, path, 0, total_bytes, now)
+
+    def file_chunk(self, device, path, n_bytes: int, done_bytes: int, total_bytes: int) -> None:
+        now = time.monotonic()
+        stats = self.devices[device]
+        stats.bytes_done += n_bytes
+        stats.last_activity = now
+        if now - self._last_chunk_emit.get(path, 0.0) >= self.chunk_interval:
+            self._last_chunk_emit[path] = now
+            self._emit(FILE_CHUNK, device, path, done_bytes, total_bytes, now)
+
+    def file_finished(self, device, path, total_bytes: int) -> None:
+        now = time.monotonic()
+        stats = self.devices[device]
+        stats.in_flight -= 1
+        stats.files_done += 1
+        stats.last_activity = now
+        self._last_chunk_emit.pop(path, None)
+        self._emit(FILE_FINISH, device, path, total_bytes, total_bytes, now)
+
+    def file_failed(self, device, path, done_bytes: int, total_bytes: int) -> None:
+        now = time.monotonic()
+        stats = self.devices[device]
+        stats.in_flight -= 1
+        stats.last_activity = now
+        self._last_chunk_emit.pop(path, None)
+        self._emit(FILE_ERROR, device, path, done_bytes, total_bytes, now)
+
+    # --- summaries -------------------------------------------------------
+
+    @property
+    def in_flight(self) -> int:
+        return sum(stats.in_flight for stats in self.devices.values())
+
+    def stalled_devices(self, idle_sec: float = 5.0) -> list:
+        """Devices with files in flight but no transferred bytes for `idle_sec` seconds"""
+        now = time.monotonic()
+        return [device for device, stats in self.devices.items()
+                if stats.in_flight and stats.last_activity is not None
+                and now - stats.last_activity >= idle_sec]
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {device: stats.as_dict(now) for device, stats in self.devices.items()}
+
+    def summary_text(self) -> str:
+        """Short human-readable progress line (e.g. for the tray tooltip)"""
+        parts = []
+        for device, stats in self.devices.items():
+            eta = stats.eta()
+            eta_str = f", ETA {eta:.0f}s" if eta is not None else ""
+            parts.append(f"{device}: {stats.files_done}/{stats.files_total} files, "
+                         f"{stats.throughput() / (1024 ** 2):.1f} MB/s{eta_str}")
+        return "\n".join(parts) if parts else "Idle"
+
+    def dump_metrics(self, filename) -> None:
+        """Write the current per-device snapshot to a JSON file"""
+        with open(filename, 'w') as file:
+            json.dump({'timestamp': time.time(), 'devices': self.snapshot()}, file, indent=2)
+        debug(f"Telemetry metrics dumped to {filename}")
+
+
+async def watch_stalls(telemetry: Telemetry, interval: float = 2.0, idle_sec: float = 5.0,
+                       on_stalled=None) -> None:
+    """Periodic stall check (a stalled device sends no events to react to), run it as a task.
+    Each stall is reported once, as a warning and through  on_stalled(devices)  if given.
+    """
+    s_reported = set()
+    while True:
+        await asyncio.sleep(interval)
+        s_stalled = set(telemetry.stalled_devices(idle_sec))
+        l_new = sorted(s_stalled - s_reported)
+        if l_new:
+            warning(f"No progress from: {', '.join(l_new)}")
+            if on_stalled is not None:
+                on_stalled(l_new)
+        s_reported = s_stalled
+
+
+def log_subscriber(event: ProgressEvent) -> None:
+    """Subscriber that forwards progress events to the loguru logger
+    (lazy formatting: messages filtered out by the level cost no string building)
+    """
+    name = os.path.basename(event.path)
+    if event.kind == FILE_CHUNK:
+        trace("[{}] {}: {}/{} bytes, {:.1f} MB/s, in flight {}", event.device, name, event.done_bytes,
+              event.total_bytes, event.bytes_per_sec / (1024 ** 2), event.in_flight)
+    elif event.kind == FILE_FINISH:
+        info("[{}] {} copied ({} bytes), in flight {}", event.device, name, event.total_bytes,
+             event.in_flight)
+    elif event.kind == FILE_ERROR:
+        warning("[{}] {} failed after {}/{} bytes", event.device, name, event.done_bytes, event.total_bytes)
+    else:
+        trace("[{}] {} started ({} bytes)", event.device, name, event.total_bytes)
\ No newline at end of file
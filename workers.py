@@ -0,0 +1,109 @@
+"""
+Module provides a process-pool execution mode for the CPU-bound stages of the pipeline.
+
+includes the per-file stage functions returning compact tuples (hashing, datetime parsing),
+the chunked batch runner amortizing IPC over many files, and the executor shared by all planning
+stages of the orchestrator. Stage functions must stay top-level so they can be pickled into
+worker processes.
+
+Result format of the runners --v
+[(item, ok: bool, payload), ...]  - payload is the stage's result if  ok , the error text otherwise
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from compact_datetime import dtstring_to_compactformat
+import profiler
+
+DEFAULT_CHUNK_SIZE = 32
+# Fewer items are processed in-process: a round trip to the workers costs more than it saves
+MIN_POOL_ITEMS = 16
+# Pooled planning stages read the card (metadata, hashes): more readers make it seek randomly
+MAX_MEDIA_WORKERS = 2
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def media_executor(workers: int = None) -> ProcessPoolExecutor:
+    """Executor of the stages reading removable media,  workers  capped by  MAX_MEDIA_WORKERS .
+    Worker processes are started on first use and kept warm until  shutdown() .
+    """
+    return ProcessPoolExecutor(max_workers=min(workers or default_workers(), MAX_MEDIA_WORKERS))
+
+
+# --- stages (run inside the workers) -------------------------------------
+
+def hash_file(file_path) -> tuple:
+    """(size, full content hash)  - the hash of the dedup index ( dedup.full_hash() )"""
+    from dedup import full_hash
+    return os.path.getsize(file_path), full_hash(file_path)
+
+
+def parse_datetime(dt_string):
+    """Compact datetime of the string"""
+    return dtstring_to_compactformat(dt_string)
+
+
+def _apply_batch(func, chunk) -> tuple:
+    """Run the stage over a whole chunk: one IPC round trip per chunk, not per file.
+    A failing item yields  (item, False, 'error text')  instead of breaking the chunk.
+    Returns  (results, seconds of every item) : spans recorded in a worker never reach the parent.
+    """
+    results, l_seconds = [], []
+    for item in chunk:
+        started = time.perf_counter()
+        try:
+            results.append((item, True, func(item)))
+        except Exception as e:
+            results.append((item, False, f"{type(e).__name__}: {e}"))
+        l_seconds.append(time.perf_counter() - started)
+    return results, l_seconds
+
+
+def _chunked(items: list, chunk_size: int):
+    for start in range(0, len(items), chunk_size):
+        yield items[start:start + chunk_size]
+
+
+def _collect(func, batches) -> list:
+    """Flatten the batches, timing every item as the  func  stage of the profiler"""
+    results = []
+    for chunk_results, l_seconds in batches:
+        results.extend(chunk_results)
+        if profiler.is_enabled():
+            for seconds in l_seconds:
+                profiler.record(func.__name__, seconds)
+    return results
+
+
+# --- runners -------------------------------------------------------------
+
+def run_in_process_pool(func, items, workers: int = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                        executor: ProcessPoolExecutor = None) -> list:
+    """Apply the stage  func  to every item in worker processes, results  (item, ok, payload)
+    keep items' order.
+
+    workers=1  runs in-process (no pool), handy for debugging and as a benchmark baseline.
+    An  executor  may be passed to reuse warm workers across calls.
+    """
+    items = list(items)
+    if executor is None and (workers or default_workers()) == 1:
+        return _collect(func, [_apply_batch(func, items)])
+
+    batch = partial(_apply_batch, func)
+    if executor is not None:
+        return _collect(func, executor.map(batch, _chunked(items, chunk_size)))
+    with ProcessPoolExecutor(max_workers=workers or default_workers()) as pool:
+        return _collect(func, pool.map(batch, _chunked(items, chunk_size)))
+
+
+def run_stage(func, items, executor: ProcessPoolExecutor = None) -> list:
+    """Apply the stage in the shared  executor , in-process without one or for a few items"""
+    items = list(items)
+    if executor is None or len(items) < MIN_POOL_ITEMS:
+        return run_in_process_pool(func, items, workers=1)
+    return run_in_process_pool(func, items, executor=executor)